@@ -4,12 +4,36 @@ import uuid
 import logging
 import zipfile
 import io
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, AsyncIterator
 from datetime import datetime
 from backend.models.schemas import GenerationResponse, FileContent, Technology
 
 logger = logging.getLogger(__name__)
 
+# Fastest DEFLATE level; generated projects are small text files where higher
+# levels cost CPU for little size gain, and Zstd ZIPs don't open in stock unzip
+ZIP_COMPRESSION = zipfile.ZIP_DEFLATED
+ZIP_COMPRESSLEVEL = 1
+
+class _ZipChunkSink(io.RawIOBase):
+    """Unseekable sink that hands back ZIP bytes as soon as they are written"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
 class CodeGenerator:
     """Simplified code generator for demonstration"""
     
@@ -1556,7 +1580,7 @@ This is a basic project structure generated by DocuGen AI.
             # Create ZIP file in memory
             zip_buffer = io.BytesIO()
             
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            with zipfile.ZipFile(zip_buffer, 'w', ZIP_COMPRESSION, compresslevel=ZIP_COMPRESSLEVEL) as zip_file:
                 for file_content in files:
                     zip_file.writestr(file_content.name, file_content.content)
             
@@ -1565,4 +1589,24 @@ This is a basic project structure generated by DocuGen AI.
             
         except Exception as e:
             logger.error(f"Error creating project ZIP: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+    
+    def iter_project_zip(self, project_id: str) -> AsyncIterator[bytes]:
+        """Stream generated project as ZIP chunks, one compressed file at a time"""
+        if project_id not in self.generated_projects:
+            raise ValueError("Project not found")
+        
+        return self._iter_zip_chunks(self.generated_projects[project_id]["files"])
+    
+    async def _iter_zip_chunks(self, files: List[FileContent]) -> AsyncIterator[bytes]:
+        """Yield ZIP bytes for the given files without buffering the archive"""
+        sink = _ZipChunkSink()
+        with zipfile.ZipFile(sink, 'w', ZIP_COMPRESSION, compresslevel=ZIP_COMPRESSLEVEL) as zip_file:
+            for file_content in files:
+                zip_file.writestr(file_content.name, file_content.content)
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+        
+        # Central directory is written when the archive is closed
+        yield sink.drain()
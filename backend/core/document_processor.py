@@ -1,10 +1,15 @@
 import os
+import html
 import hashlib
 import asyncio
 import logging
-from typing import Optional, List, Dict, Any
+import contextlib
+import concurrent.futures
+import mmap
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Set, Union, BinaryIO, Callable, Tuple
 from datetime import datetime
-import requests
+import httpx
 from bs4 import BeautifulSoup
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 try:
@@ -15,14 +20,258 @@ import chromadb
 import markdown
 import pypdf
 import io
+import xxhash
+try:
+    import mistune
+except ImportError:
+    mistune = None
 
 logger = logging.getLogger(__name__)
 
-class DocumentProcessor:
-    def __init__(self):
+# Maximum number of chunks sent to ChromaDB in a single add() call
+CHROMA_ADD_BATCH_SIZE = 1000
+
+# Chunks embedded per backend call, and how long to wait for a batch to fill
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_BATCH_WAIT = 0.05
+
+# Number of query embeddings kept in the in-process LRU cache
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+
+# Inline Markdown AST nodes; everything else is a block and ends a line
+MARKDOWN_INLINE_TOKENS = frozenset({
+    "text", "emphasis", "strong", "link", "image", "codespan", "inline_html", "strikethrough",
+})
+
+# SQLite PRAGMAs applied while bulk-inserting chunks. Documents are
+# content-addressed, so an interrupted ingest is recovered by re-processing
+# the source rather than relying on per-transaction fsyncs.
+BULK_INSERT_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "temp_store": "MEMORY",
+    "locking_mode": "EXCLUSIVE",
+}
+
+# Mistune AST nodes carrying raw HTML, reduced to their text content
+MARKDOWN_HTML_TOKENS = frozenset({"block_html", "inline_html"})
+
+# Mistune AST nodes whose raw text may hold HTML entities (mistune 3.0 escapes code spans too)
+MARKDOWN_ESCAPED_TOKENS = frozenset({"text", "codespan"})
+
+def _iter_markdown_text(tokens: List[Dict[str, Any]]):
+    """Yield the plain text of a mistune AST without rendering HTML"""
+    for token in tokens:
+        if token["type"] in MARKDOWN_HTML_TOKENS:
+            yield BeautifulSoup(token["raw"], 'html.parser').get_text()
+        elif token["type"] in MARKDOWN_ESCAPED_TOKENS:
+            yield html.unescape(token["raw"])
+        elif "raw" in token:
+            yield token["raw"]
+        elif "children" in token:
+            yield from _iter_markdown_text(token["children"])
+        if token["type"] == "softbreak" or token["type"] not in MARKDOWN_INLINE_TOKENS:
+            yield "\n"
+
+_markdown_ast = mistune.create_markdown(renderer=None) if mistune else None
+
+def _markdown_to_text(md_content: str) -> str:
+    """Serialize Python-Markdown's element tree straight to plain text"""
+    md = markdown.Markdown()
+    md.serializer = lambda root: "".join(root.itertext())
+    md.stripTopLevelTags = False
+    md.postprocessors.deregister("raw_html")
+    text = md.convert(md_content)
+
+    # Raw HTML and entities are stashed during parsing; keep only their text
+    def _restore(match):
+        raw = md.htmlStash.rawHtmlBlocks[int(match.group(1))]
+        if not isinstance(raw, str):
+            return "".join(raw.itertext())
+        return BeautifulSoup(raw, 'html.parser').get_text() if "<" in raw else raw
+
+    return html.unescape(markdown.util.HTML_PLACEHOLDER_RE.sub(_restore, text))
+
+# Read size used when hashing file-backed uploads
+HASH_CHUNK_SIZE = 64 * 1024
+
+def _read_source(source: Union[bytes, BinaryIO]) -> bytes:
+    """Return the full contents of an upload given as bytes or a binary file"""
+    if isinstance(source, bytes):
+        return source
+    source.seek(0)
+    return source.read()
+
+def _content_digest(source: Union[bytes, BinaryIO]) -> str:
+    """MD5 of an upload, hashing file-backed sources chunk by chunk"""
+    if isinstance(source, bytes):
+        return hashlib.md5(source).hexdigest()
+    digest = hashlib.md5()
+    source.seek(0)
+    while chunk := source.read(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def _file_extension(filename: Optional[str]) -> str:
+    """Lowercase extension of an upload's name, without the dot"""
+    return os.path.splitext(filename or "")[1].lower().lstrip(".")
+
+@contextlib.contextmanager
+def _open_pdf_stream(source: Union[bytes, BinaryIO]):
+    """Yield a seekable PDF stream, memory-mapping file-backed sources"""
+    if isinstance(source, bytes):
+        # BytesIO shares the bytes buffer until written to, so this is no copy
+        yield io.BytesIO(source)
+        return
+    try:
+        # fileno() forces a SpooledTemporaryFile to roll over to disk, so
+        # only map uploads that are already disk-backed
+        if not getattr(source, "_rolled", True):
+            raise io.UnsupportedOperation("in-memory spooled file")
+        mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        source.seek(0)
+        yield source
+        return
+    with mapped:
+        yield mapped
+
+class EmbeddingBatcher:
+    """Coalesce concurrent chunk embeddings into batched backend calls"""
+
+    def __init__(self, embed_documents: Callable[[List[str]], List[List[float]]],
+                 max_batch_size: int = EMBEDDING_BATCH_SIZE, max_wait: float = EMBEDDING_BATCH_WAIT):
+        self._embed_documents = embed_documents
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # The event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> List[float]:
+        """Queue a text for the next batch and wait for its embedding"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(
+                None, self._embed_documents, [text for text, _ in batch]
+            )
+            if len(vectors) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            logger.error(f"Error embedding batch of {len(batch)} chunks: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+class TextExtractor:
+    """Stateless file-to-text extraction, safe to send to worker processes"""
+    
+    def _extract_text_from_file(self, file_content: Union[bytes, BinaryIO], filename: str) -> str:
+        """Extract text from uploaded file based on file type"""
+        file_extension = _file_extension(filename)
+        
+        if file_extension == 'pdf':
+            # PDFs are read straight from the file so disk-backed uploads can be mmapped
+            return self._extract_text_from_pdf(file_content)
+        
+        file_content = _read_source(file_content)
+        if file_extension in ['md', 'markdown']:
+            return self._extract_text_from_markdown(file_content)
+        elif file_extension == 'rst':
+            return file_content.decode('utf-8', errors='replace')
+        elif file_extension == 'docx':
+            return self._extract_text_from_docx(file_content)
+        elif file_extension in ['txt', 'html', 'htm']:
+            return file_content.decode('utf-8', errors='replace')
+        else:
+            # Try to decode as text
+            try:
+                return file_content.decode('utf-8')
+            except UnicodeDecodeError:
+                raise ValueError(f"Unsupported file type: {file_extension}")
+    
+    def _extract_text_from_pdf(self, file_content: Union[bytes, BinaryIO]) -> str:
+        """Extract text from PDF content"""
+        try:
+            with _open_pdf_stream(file_content) as pdf_file:
+                pdf_reader = pypdf.PdfReader(pdf_file)
+                
+                text = ""
+                for page in pdf_reader.pages:
+                    text += page.extract_text() + "\n"
+            
+            return text
+        except Exception as e:
+            logger.error(f"Error extracting text from PDF: {str(e)}")
+            raise
+    
+    def _extract_text_from_markdown(self, file_content: bytes) -> str:
+        """Extract text from Markdown content"""
+        try:
+            md_content = file_content.decode('utf-8')
+            if _markdown_ast is not None:
+                return "".join(_iter_markdown_text(_markdown_ast(md_content)))
+            return _markdown_to_text(md_content)
+        except Exception as e:
+            logger.error(f"Error extracting text from Markdown: {str(e)}")
+            raise
+    
+    def _extract_text_from_docx(self, file_content: bytes) -> str:
+        """Extract text from DOCX content"""
+        try:
+            import zipfile
+            docx_file = io.BytesIO(file_content)
+            with zipfile.ZipFile(docx_file) as zf:
+                xml_content = zf.read('word/document.xml')
+            soup = BeautifulSoup(xml_content, 'html.parser')
+            paragraphs = soup.find_all('w:t')
+            return ' '.join(p.get_text() for p in paragraphs)
+        except Exception as e:
+            logger.error(f"Error extracting text from DOCX: {str(e)}")
+            raise
+
+# Shared extractor handed to the CPU pool instead of the (unpicklable) processor
+_EXTRACTOR = TextExtractor()
+
+class DocumentProcessor(TextExtractor):
+    def __init__(self, cpu_pool: Optional[concurrent.futures.Executor] = None):
         self.chroma_client = None
         self.embeddings = None
+        self._http: Optional[httpx.AsyncClient] = None
         self.document_index: Dict[str, Dict[str, Any]] = {}
+        self._query_cache: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        # Chunks from concurrent ingests share embedding calls
+        self._embedding_batcher = EmbeddingBatcher(self._embed_documents)
+        # PDF parsing runs here instead of on the event loop; the pool is
+        # owned (and shut down) by whoever passes it in
+        self._cpu_pool = cpu_pool
+        # Cleared the first time chromadb's SQLite internals can't be reached
+        self._bulk_mode_available = True
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
@@ -53,8 +302,8 @@ class DocumentProcessor:
     async def process_url(self, url: str) -> str:
         """Process documentation from a URL"""
         try:
-            # Generate document ID from URL
-            doc_id = hashlib.md5(url.encode()).hexdigest()
+            # Generate document ID from URL (non-cryptographic hash is enough here)
+            doc_id = xxhash.xxh3_64(url.encode()).hexdigest()
             
             # Check if already processed
             if self._is_processed(doc_id):
@@ -63,11 +312,12 @@ class DocumentProcessor:
             
             # Fetch content from URL
             logger.info(f"Fetching content from {url}")
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
+            async with self._get_http_client().stream("GET", url) as response:
+                response.raise_for_status()
+                content = b"".join([chunk async for chunk in response.aiter_bytes()])
             
             # Parse HTML content
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = BeautifulSoup(content, 'html.parser')
             
             # Extract text content
             text_content = self._extract_text_from_html(soup)
@@ -81,19 +331,30 @@ class DocumentProcessor:
             logger.error(f"Error processing URL {url}: {str(e)}")
             raise
     
-    async def process_file(self, file_content: bytes, filename: str) -> str:
-        """Process uploaded documentation file"""
+    async def process_file(self, file_content: Union[bytes, BinaryIO], filename: str) -> str:
+        """Process uploaded documentation file (bytes or a binary file object)"""
         try:
             # Generate document ID from file content
-            doc_id = hashlib.md5(file_content).hexdigest()
+            doc_id = _content_digest(file_content)
             
             # Check if already processed
             if self._is_processed(doc_id):
                 logger.info(f"Document {doc_id} already processed")
                 return doc_id
             
-            # Extract text based on file type
-            text_content = self._extract_text_from_file(file_content, filename)
+            # Extract text based on file type. PDF parsing is the CPU-bound
+            # case, so PDFs are read into bytes off the loop and parsed in the
+            # pool; everything else is extracted in place on a thread
+            loop = asyncio.get_event_loop()
+            if self._cpu_pool is not None and _file_extension(filename) == 'pdf':
+                pdf_content = await loop.run_in_executor(None, _read_source, file_content)
+                text_content = await loop.run_in_executor(
+                    self._cpu_pool, _EXTRACTOR._extract_text_from_pdf, pdf_content
+                )
+            else:
+                text_content = await loop.run_in_executor(
+                    None, self._extract_text_from_file, file_content, filename
+                )
             
             # Process and store the content
             await self._process_and_store(doc_id, text_content, filename=filename)
@@ -104,6 +365,18 @@ class DocumentProcessor:
             logger.error(f"Error processing file {filename}: {str(e)}")
             raise
     
+    async def aclose(self):
+        """Close the shared HTTP client"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+    
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it on first use"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=30, follow_redirects=True)
+        return self._http
+    
     def _extract_text_from_html(self, soup: BeautifulSoup) -> str:
         """Extract clean text from HTML soup"""
         # Remove script and style elements
@@ -120,72 +393,13 @@ class DocumentProcessor:
         
         return text
     
-    def _extract_text_from_file(self, file_content: bytes, filename: str) -> str:
-        """Extract text from uploaded file based on file type"""
-        file_extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
-        
-        if file_extension == 'pdf':
-            return self._extract_text_from_pdf(file_content)
-        elif file_extension in ['md', 'markdown']:
-            return self._extract_text_from_markdown(file_content)
-        elif file_extension == 'rst':
-            return file_content.decode('utf-8', errors='replace')
-        elif file_extension == 'docx':
-            return self._extract_text_from_docx(file_content)
-        elif file_extension in ['txt', 'html', 'htm']:
-            return file_content.decode('utf-8', errors='replace')
-        else:
-            # Try to decode as text
-            try:
-                return file_content.decode('utf-8')
-            except UnicodeDecodeError:
-                raise ValueError(f"Unsupported file type: {file_extension}")
-    
-    def _extract_text_from_pdf(self, file_content: bytes) -> str:
-        """Extract text from PDF content"""
-        try:
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = pypdf.PdfReader(pdf_file)
-            
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            
-            return text
-        except Exception as e:
-            logger.error(f"Error extracting text from PDF: {str(e)}")
-            raise
-    
-    def _extract_text_from_markdown(self, file_content: bytes) -> str:
-        """Extract text from Markdown content"""
-        try:
-            md_content = file_content.decode('utf-8')
-            html = markdown.markdown(md_content)
-            soup = BeautifulSoup(html, 'html.parser')
-            return soup.get_text()
-        except Exception as e:
-            logger.error(f"Error extracting text from Markdown: {str(e)}")
-            raise
-    
-    def _extract_text_from_docx(self, file_content: bytes) -> str:
-        """Extract text from DOCX content"""
-        try:
-            import zipfile
-            docx_file = io.BytesIO(file_content)
-            with zipfile.ZipFile(docx_file) as zf:
-                xml_content = zf.read('word/document.xml')
-            soup = BeautifulSoup(xml_content, 'html.parser')
-            paragraphs = soup.find_all('w:t')
-            return ' '.join(p.get_text() for p in paragraphs)
-        except Exception as e:
-            logger.error(f"Error extracting text from DOCX: {str(e)}")
-            raise
-    
     async def _process_and_store(self, doc_id: str, text_content: str, url: Optional[str] = None, filename: Optional[str] = None):
         """Process text content and store in vector database"""
         try:
             # Split text into chunks
-            chunks = self.text_splitter.split_text(text_content)
+            chunks = await asyncio.get_event_loop().run_in_executor(
+                None, self.text_splitter.split_text, text_content
+            )
             logger.info(f"Split document into {len(chunks)} chunks")
             processed_at = datetime.now().isoformat()
             
@@ -195,28 +409,25 @@ class DocumentProcessor:
                 metadata={"doc_id": doc_id, "url": url, "filename": filename, "processed_at": processed_at}
             )
             
-            # Generate embeddings and store chunks
+            # Generate embeddings before touching the database
+            embeddings = None
             if self.embeddings:
-                for i, chunk in enumerate(chunks):
-                    # Generate embedding
-                    embedding = await asyncio.get_event_loop().run_in_executor(
-                        None, self.embeddings.embed_query, chunk
-                    )
-                    
-                    # Store in ChromaDB
-                    collection.add(
-                        embeddings=[embedding],
-                        documents=[chunk],
-                        ids=[f"{doc_id}_{i}"],
-                        metadatas=[{"chunk_index": i, "doc_id": doc_id}]
-                    )
-            else:
-                # Store without embeddings (for fallback)
-                for i, chunk in enumerate(chunks):
+                embeddings = await asyncio.gather(
+                    *(self._embedding_batcher.embed(chunk) for chunk in chunks)
+                )
+
+            # Store chunks in ChromaDB (without embeddings as a fallback)
+            prefix = f"{doc_id}_"
+            ids = [prefix + str(i) for i in range(len(chunks))]
+            metadatas = [{"chunk_index": i, "doc_id": doc_id} for i in range(len(chunks))]
+            with self._bulk_mode():
+                for start in range(0, len(chunks), CHROMA_ADD_BATCH_SIZE):
+                    end = start + CHROMA_ADD_BATCH_SIZE
                     collection.add(
-                        documents=[chunk],
-                        ids=[f"{doc_id}_{i}"],
-                        metadatas=[{"chunk_index": i, "doc_id": doc_id}]
+                        embeddings=embeddings[start:end] if embeddings is not None else None,
+                        documents=chunks[start:end],
+                        ids=ids[start:end],
+                        metadatas=metadatas[start:end]
                     )
             
             logger.info(f"Stored {len(chunks)} chunks for document {doc_id}")
@@ -233,6 +444,40 @@ class DocumentProcessor:
             logger.error(f"Error processing and storing document: {str(e)}")
             raise
     
+    @contextlib.contextmanager
+    def _bulk_mode(self):
+        """Relax SQLite durability settings for the duration of a bulk insert"""
+        pool = None
+        conn = None
+        previous = {}
+        if self._bulk_mode_available:
+            try:
+                # chromadb 0.4.x wraps the segment API behind Client._server;
+                # the Rust-backed 1.x clients expose no SQLite pool at all
+                server = getattr(self.chroma_client, "_server", self.chroma_client)
+                pool = server._sysdb._conn_pool
+                conn = pool.connect()
+                for pragma, value in BULK_INSERT_PRAGMAS.items():
+                    previous[pragma] = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+                    conn.execute(f"PRAGMA {pragma}={value}")
+            except Exception as e:
+                self._bulk_mode_available = False
+                logger.warning(f"Bulk insert mode unavailable, using default SQLite settings: {str(e)}")
+
+        try:
+            yield
+        finally:
+            if conn is not None:
+                try:
+                    for pragma, value in previous.items():
+                        conn.execute(f"PRAGMA {pragma}={value}")
+                    # Leaving EXCLUSIVE locking_mode only drops the lock on the next access
+                    conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+                except Exception as e:
+                    logger.warning(f"Error restoring SQLite settings after bulk insert: {str(e)}")
+                finally:
+                    pool.return_to_pool(conn)
+    
     def _is_processed(self, doc_id: str) -> bool:
         """Check if document is already processed"""
         try:
@@ -248,10 +493,8 @@ class DocumentProcessor:
             collection = self.chroma_client.get_collection(f"doc_{doc_id}")
             
             if self.embeddings:
-                # Generate query embedding
-                query_embedding = await asyncio.get_event_loop().run_in_executor(
-                    None, self.embeddings.embed_query, query
-                )
+                # Generate query embedding (cached for repeat queries)
+                query_embedding = await self._embed_query(query)
                 
                 # Search with embedding
                 results = collection.query(
@@ -271,6 +514,26 @@ class DocumentProcessor:
             logger.error(f"Error querying documents: {str(e)}")
             return []
 
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of chunks with the configured embeddings backend"""
+        return self.embeddings.embed_documents(texts)
+
+    async def _embed_query(self, query: str) -> List[float]:
+        """Embed a query, reusing the cached embedding for repeat queries"""
+        model = getattr(self.embeddings, "model", "")
+        key = hashlib.blake2b(f"{model}\0{query}".encode()).digest()
+        if key in self._query_cache:
+            self._query_cache.move_to_end(key)
+            return self._query_cache[key]
+
+        query_embedding = await asyncio.get_event_loop().run_in_executor(
+            None, self.embeddings.embed_query, query
+        )
+        self._query_cache[key] = query_embedding
+        if len(self._query_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        return query_embedding
+
     def get_document_summary(self, doc_id: str) -> Dict[str, Any]:
         """Return summary metadata for a processed document."""
         if doc_id in self.document_index:
@@ -1,17 +1,91 @@
 import os
 import hashlib
 import logging
-from typing import List, Dict, Any
+import contextlib
+import mmap
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import List, Dict, Any, Optional, Union, BinaryIO
 from datetime import datetime
 import io
 
 logger = logging.getLogger(__name__)
 
+class _LRUDict(OrderedDict):
+    """Dict that evicts its least recently used entries beyond maxsize"""
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+# Read size used when hashing file-backed uploads
+HASH_CHUNK_SIZE = 64 * 1024
+
+def _read_source(source: Union[bytes, BinaryIO]) -> bytes:
+    """Return the full contents of an upload given as bytes or a binary file"""
+    if isinstance(source, bytes):
+        return source
+    source.seek(0)
+    return source.read()
+
+def _content_digest(source: Union[bytes, BinaryIO]) -> str:
+    """MD5 of an upload, hashing file-backed sources chunk by chunk"""
+    if isinstance(source, bytes):
+        return hashlib.md5(source).hexdigest()
+    digest = hashlib.md5()
+    source.seek(0)
+    while chunk := source.read(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def _source_size(source: Union[bytes, BinaryIO]) -> int:
+    """Size in bytes of an upload given as bytes or a binary file"""
+    if isinstance(source, bytes):
+        return len(source)
+    return source.seek(0, os.SEEK_END)
+
+@contextlib.contextmanager
+def _open_pdf_stream(source: Union[bytes, BinaryIO]):
+    """Yield a seekable PDF stream, memory-mapping file-backed sources"""
+    if isinstance(source, bytes):
+        yield io.BytesIO(source)
+        return
+    try:
+        # fileno() forces a SpooledTemporaryFile to roll over to disk, so
+        # only map uploads that are already disk-backed
+        if not getattr(source, "_rolled", True):
+            raise io.UnsupportedOperation("in-memory spooled file")
+        mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        source.seek(0)
+        yield source
+        return
+    with mapped:
+        yield mapped
+
 class DocumentProcessor:
     """Simplified document processor that extracts real content from files"""
     
-    def __init__(self):
-        self.processed_docs = {}  # In-memory storage
+    def __init__(self, cpu_pool: Optional[Executor] = None):
+        # cpu_pool mirrors the full processor's signature; the simplified
+        # extractors are light enough to run inline, so it is unused here
+
+        # In-memory storage, bounded so long-running servers don't grow forever
+        self.processed_docs = _LRUDict(int(os.getenv("DOC_CACHE", "100")))
         logger.info("DocumentProcessor initialized (simplified mode)")
     
     async def process_url(self, url: str) -> str:
@@ -38,11 +112,11 @@ class DocumentProcessor:
             logger.error(f"Error processing URL {url}: {str(e)}")
             raise
     
-    async def process_file(self, file_content: bytes, filename: str) -> str:
-        """Process uploaded documentation file"""
+    async def process_file(self, file_content: Union[bytes, BinaryIO], filename: str) -> str:
+        """Process uploaded documentation file (bytes or a binary file object)"""
         try:
             # Generate document ID from file content
-            doc_id = hashlib.md5(file_content).hexdigest()
+            doc_id = _content_digest(file_content)
             
             logger.info(f"Processing file: {filename}")
             
@@ -55,7 +129,7 @@ class DocumentProcessor:
                 "processed_at": datetime.now().isoformat(),
                 "type": "file",
                 "content": text_content,
-                "file_size": len(file_content),
+                "file_size": _source_size(file_content),
             }
             
             logger.info(f"Document {doc_id} processed successfully ({len(text_content)} chars extracted)")
@@ -65,6 +139,9 @@ class DocumentProcessor:
             logger.error(f"Error processing file {filename}: {str(e)}")
             raise
 
+    async def aclose(self):
+        """Release resources; the simplified processor holds none"""
+
     def get_document_summary(self, doc_id: str) -> Dict[str, Any]:
         """Return summary metadata for a processed document."""
         doc = self.processed_docs.get(doc_id)
@@ -88,13 +165,16 @@ class DocumentProcessor:
             "file_size": doc.get("file_size"),
         }
 
-    def _extract_text_from_file(self, file_content: bytes, filename: str) -> str:
+    def _extract_text_from_file(self, file_content: Union[bytes, BinaryIO], filename: str) -> str:
         """Extract text from uploaded file based on file type"""
         ext = os.path.splitext(filename or "")[1].lower()
 
         if ext == ".pdf":
+            # PDFs are read straight from the file so disk-backed uploads can be mmapped
             return self._extract_text_from_pdf(file_content)
-        elif ext in (".md", ".markdown"):
+
+        file_content = _read_source(file_content)
+        if ext in (".md", ".markdown"):
             return self._extract_text_from_markdown(file_content)
         elif ext == ".rst":
             return self._extract_text_from_rst(file_content)
@@ -106,15 +186,15 @@ class DocumentProcessor:
             except Exception:
                 raise ValueError(f"Unsupported file type: {ext}")
 
-    def _extract_text_from_pdf(self, file_content: bytes) -> str:
+    def _extract_text_from_pdf(self, file_content: Union[bytes, BinaryIO]) -> str:
         """Extract text from PDF content"""
         try:
             import pypdf
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = pypdf.PdfReader(pdf_file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
+            with _open_pdf_stream(file_content) as pdf_file:
+                pdf_reader = pypdf.PdfReader(pdf_file)
+                text = ""
+                for page in pdf_reader.pages:
+                    text += page.extract_text() + "\n"
             return text
         except ImportError:
             logger.warning("pypdf not available, storing raw filename reference")
@@ -128,6 +208,7 @@ class DocumentProcessor:
         try:
             md_content = file_content.decode("utf-8", errors="replace")
             try:
+                import html
                 import markdown as md_lib
                 from html.parser import HTMLParser
 
@@ -138,10 +219,22 @@ class DocumentProcessor:
                     def handle_data(self, data: str):
                         self.parts.append(data)
 
-                html = md_lib.markdown(md_content)
-                extractor = _TextExtractor()
-                extractor.feed(html)
-                return " ".join(extractor.parts)
+                def _restore(match):
+                    raw = md.htmlStash.rawHtmlBlocks[int(match.group(1))]
+                    if not isinstance(raw, str):
+                        return "".join(raw.itertext())
+                    extractor = _TextExtractor()
+                    extractor.feed(raw)
+                    return "".join(extractor.parts)
+
+                # Serialize the element tree to text directly; only stashed
+                # raw HTML snippets still go through the HTML parser
+                md = md_lib.Markdown()
+                md.serializer = lambda root: "".join(root.itertext())
+                md.stripTopLevelTags = False
+                md.postprocessors.deregister("raw_html")
+                text = md.convert(md_content)
+                return html.unescape(md_lib.util.HTML_PLACEHOLDER_RE.sub(_restore, text))
             except ImportError:
                 # Fallback: return the raw markdown text (still useful)
                 return md_content
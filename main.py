@@ -1,123 +1,174 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response
 import os
 import sys
+import importlib.util
+import functools
 import logging
-from typing import Optional, List
-import io
+import asyncio
+import concurrent.futures
+import multiprocessing
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
 # File upload configuration
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
-ALLOWED_EXTENSIONS = {'.pdf', '.md', '.markdown', '.txt', '.html', '.htm', '.rst', '.docx'}
+MAX_CONCURRENT_UPLOADS = 16  # Files processed in parallel per multi-upload request
+UPLOAD_READ_CHUNK_SIZE = 64 * 1024  # Uploads are read and size-checked in 64 KB chunks
+ALLOWED_EXTENSIONS = frozenset({'.pdf', '.md', '.markdown', '.txt', '.html', '.htm', '.rst', '.docx'})
+ALLOWED_EXT_SORTED = tuple(sorted(ALLOWED_EXTENSIONS))
+UNSUPPORTED_MSG_SUFFIX = ", ".join(ALLOWED_EXT_SORTED)
 
-# Add the project root to the Python path
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# Project downloads via nginx X-Accel-Redirect (disabled unless a directory is set)
+PROJECTS_ACCEL_DIR = os.getenv("PROJECTS_ACCEL_DIR")
+PROJECTS_ACCEL_LOCATION = os.getenv("PROJECTS_ACCEL_LOCATION", "/internal/projects/")
+# Persisted ZIPs not downloaded for this many seconds are deleted (0 leaves cleanup to the operator)
+PROJECTS_ACCEL_MAX_AGE = int(os.getenv("PROJECTS_ACCEL_MAX_AGE", 24 * 60 * 60))
+INLINE_ZIP_MAX_SIZE = 1024 * 1024  # Smaller ZIPs are sent in one response body instead of streamed
 
-# Try to import core modules, provide fallback if dependencies are missing
-try:
+# Dev frontend origins, matched by Starlette with one precompiled regex
+CORS_ORIGIN_REGEX = r"http://(localhost|127\.0\.0\.1):3000"
+
+# React build entry point
+FRONTEND_INDEX = "frontend/build/index.html"
+
+# Add the project root to the Python path once, ahead of site-packages
+_PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+
+# Third-party packages required by the full (ChromaDB + OpenAI) pipeline.
+# Probing their specs is far cheaper than importing langchain only to fail
+# later on a missing chromadb.
+FULL_MODE_PACKAGES = ("chromadb", "langchain", "openai", "bs4", "pypdf", "markdown", "httpx", "xxhash")
+
+from backend.models.schemas import GenerationRequest, GenerationResponse, DocumentSummary
+
+# Use the full pipeline when its dependencies are installed, else the simplified one
+_missing = [name for name in FULL_MODE_PACKAGES if importlib.util.find_spec(name) is None]
+if _missing:
+    print(f"Warning: Some dependencies are missing: {', '.join(_missing)}")
+    print("Using simplified mode for demonstration.")
+    from backend.core.document_processor_simple import DocumentProcessor
+    from backend.core.code_generator_simple import CodeGenerator
+else:
     from backend.core.document_processor import DocumentProcessor
     from backend.core.code_generator import CodeGenerator
-    from backend.models.schemas import GenerationRequest, GenerationResponse, DocumentSummary
-    CORE_AVAILABLE = True
-except ImportError as e:
-    print(f"Warning: Some dependencies are missing: {e}")
-    print("Using simplified mode for demonstration.")
-    try:
-        from backend.core.document_processor_simple import DocumentProcessor
-        from backend.core.code_generator_simple import CodeGenerator
-        from backend.models.schemas import GenerationRequest, GenerationResponse, DocumentSummary
-        CORE_AVAILABLE = True
-    except ImportError as e2:
-        print(f"Error: Cannot load simplified modules: {e2}")
-        CORE_AVAILABLE = False
-        
-        # Minimal fallback schemas
-        from pydantic import BaseModel
-        
-        class GenerationRequest(BaseModel):
-            doc_id: str
-            prompt: str
-            technology: Optional[str] = None
-        
-        class GenerationResponse(BaseModel):
-            project_id: str
-            files: List[dict]
-            structure: dict
-            instructions: str
-
-        class DocumentSummary(BaseModel):
-            doc_id: str
-            source_type: str
-            source_name: str
-            processed_at: str
-            status: str
-            char_count: int
-            approx_chunks: int
-            preview: str
-            file_size: Optional[int] = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="DocuGen AI", description="Documentation-aware project scaffolding engine")
+def _build_components(cpu_pool: concurrent.futures.Executor):
+    """Construct the document processor and code generator."""
+    # Sequential on purpose: both open the same ChromaDB store on disk
+    return DocumentProcessor(cpu_pool=cpu_pool), CodeGenerator()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize core components off the event loop before serving requests."""
+    # forkserver: forking the threaded server process directly can deadlock
+    cpu_pool = concurrent.futures.ProcessPoolExecutor(
+        mp_context=multiprocessing.get_context("forkserver")
+    )
+    try:
+        app.state.document_processor, app.state.code_generator = await asyncio.to_thread(
+            _build_components, cpu_pool
+        )
+        yield
+    finally:
+        document_processor = getattr(app.state, "document_processor", None)
+        if document_processor is not None:
+            await document_processor.aclose()
+        cpu_pool.shutdown()
+
+app = FastAPI(
+    title="DocuGen AI",
+    description="Documentation-aware project scaffolding engine",
+    lifespan=lifespan,
+)
 
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
+    allow_origin_regex=CORS_ORIGIN_REGEX,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Initialize core components
-if CORE_AVAILABLE:
-    document_processor = DocumentProcessor()
-    code_generator = CodeGenerator()
-else:
-    document_processor = None
-    code_generator = None
+@functools.cache
+def _index_path() -> Optional[str]:
+    """Path of the built frontend index, checked once per process."""
+    return FRONTEND_INDEX if os.path.isfile(FRONTEND_INDEX) else None
 
 @app.get("/")
 async def root():
-    if os.path.exists("frontend/build/index.html"):
-        return FileResponse("frontend/build/index.html")
+    index_path = _index_path()
+    if index_path:
+        return FileResponse(index_path)
     return {"message": "DocuGen AI - Documentation-aware project scaffolding engine"}
 
 @app.post("/api/process-documentation")
-async def process_documentation(url: str):
+async def process_documentation(url: str, http_request: Request):
     """Process documentation from a URL"""
     try:
-        result = await document_processor.process_url(url)
+        result = await http_request.app.state.document_processor.process_url(url)
         return {"status": "success", "message": "Documentation processed successfully", "doc_id": result}
     except Exception as e:
         logger.error(f"Error processing documentation: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def _validate_upload(filename: str, content: bytes) -> None:
-    """Validate uploaded file extension and size."""
-    ext = os.path.splitext(filename or "")[1].lower()
+def _validate_extension(filename: str) -> None:
+    """Validate uploaded file extension."""
+    name = filename or ""
+    dot = name.rfind(".")
+    ext = name[dot:].lower() if dot >= 0 else ""
     if ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
-            detail=f"Unsupported file type '{ext}'. Allowed: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
+            detail=f"Unsupported file type '{ext}'. Allowed: {UNSUPPORTED_MSG_SUFFIX}"
         )
-    if len(content) > MAX_FILE_SIZE:
+
+def _validate_size(size: int) -> None:
+    """Validate uploaded file size."""
+    if size > MAX_FILE_SIZE:
         raise HTTPException(
             status_code=400,
             detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE // (1024 * 1024)} MB"
         )
 
+def _validate_not_empty(size: int) -> None:
+    """Reject zero-byte uploads."""
+    if size == 0:
+        raise HTTPException(status_code=400, detail="File is empty")
+
+async def _check_upload(file: UploadFile) -> None:
+    """Stream through an upload to validate it, then rewind it for processing."""
+    _validate_extension(file.filename)
+    if file.size is not None:
+        # Starlette already counted the bytes while parsing the form
+        _validate_size(file.size)
+        _validate_not_empty(file.size)
+        return
+    
+    size = 0
+    while chunk := await file.read(UPLOAD_READ_CHUNK_SIZE):
+        size += len(chunk)
+        _validate_size(size)
+    _validate_not_empty(size)
+    await file.seek(0)
+
 @app.post("/api/upload-documentation")
-async def upload_documentation(file: UploadFile = File(...)):
+async def upload_documentation(http_request: Request, file: UploadFile = File(...)):
     """Upload and process a single documentation file"""
     try:
-        content = await file.read()
-        _validate_upload(file.filename, content)
-        result = await document_processor.process_file(content, file.filename)
+        await _check_upload(file)
+        result = await http_request.app.state.document_processor.process_file(file.file, file.filename)
         return {"status": "success", "message": "Documentation uploaded and processed", "doc_id": result}
     except HTTPException:
         raise
@@ -126,29 +177,32 @@ async def upload_documentation(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/upload-multiple-documentation")
-async def upload_multiple_documentation(files: List[UploadFile] = File(...)):
+async def upload_multiple_documentation(http_request: Request, files: List[UploadFile] = File(...)):
     """Upload and process multiple documentation files"""
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
 
-    results = []
-    errors = []
-    for file in files:
-        try:
-            content = await file.read()
-            _validate_upload(file.filename, content)
-            doc_id = await document_processor.process_file(content, file.filename)
-            results.append({"filename": file.filename, "doc_id": doc_id, "status": "success"})
-        except HTTPException as he:
-            errors.append({"filename": file.filename, "error": he.detail})
-        except Exception as e:
-            logger.error(f"Error uploading {file.filename}: {str(e)}")
-            errors.append(
-                {
+    document_processor = http_request.app.state.document_processor
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+
+    async def _process_upload(file: UploadFile):
+        async with semaphore:
+            try:
+                await _check_upload(file)
+                doc_id = await document_processor.process_file(file.file, file.filename)
+                return True, {"filename": file.filename, "doc_id": doc_id, "status": "success"}
+            except HTTPException as he:
+                return False, {"filename": file.filename, "error": he.detail}
+            except Exception as e:
+                logger.error(f"Error uploading {file.filename}: {str(e)}")
+                return False, {
                     "filename": file.filename,
                     "error": "Internal server error while processing file",
                 }
-            )
+
+    outcomes = await asyncio.gather(*(_process_upload(file) for file in files))
+    results = [outcome for ok, outcome in outcomes if ok]
+    errors = [outcome for ok, outcome in outcomes if not ok]
 
     if not results:
         raise HTTPException(status_code=400, detail=f"All uploads failed: {errors}")
@@ -164,15 +218,15 @@ async def upload_multiple_documentation(files: List[UploadFile] = File(...)):
 async def supported_formats():
     """Return the list of supported file formats for upload"""
     return {
-        "formats": sorted(ALLOWED_EXTENSIONS),
+        "formats": ALLOWED_EXT_SORTED,
         "max_file_size_mb": MAX_FILE_SIZE // (1024 * 1024),
     }
 
 @app.get("/api/documents/{doc_id}", response_model=DocumentSummary)
-async def get_document_summary(doc_id: str):
+async def get_document_summary(doc_id: str, http_request: Request):
     """Return summary metadata for a processed document."""
     try:
-        summary = document_processor.get_document_summary(doc_id)
+        summary = http_request.app.state.document_processor.get_document_summary(doc_id)
         return summary
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -181,10 +235,10 @@ async def get_document_summary(doc_id: str):
         raise HTTPException(status_code=500, detail="Failed to fetch document summary")
 
 @app.post("/api/generate-project", response_model=GenerationResponse)
-async def generate_project(request: GenerationRequest):
+async def generate_project(request: GenerationRequest, http_request: Request):
     """Generate project based on documentation and user prompt"""
     try:
-        result = await code_generator.generate_project(
+        result = await http_request.app.state.code_generator.generate_project(
             doc_id=request.doc_id,
             prompt=request.prompt,
             technology=request.technology
@@ -194,17 +248,81 @@ async def generate_project(request: GenerationRequest):
         logger.error(f"Error generating project: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _touch_project_zip(zip_path: str) -> bool:
+    """Mark an already persisted ZIP as recently downloaded; False if there is none"""
+    try:
+        os.utime(zip_path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def _evict_project_zips() -> None:
+    """Delete persisted ZIPs (and abandoned temp files) older than PROJECTS_ACCEL_MAX_AGE"""
+    cutoff = time.time() - PROJECTS_ACCEL_MAX_AGE
+    with os.scandir(PROJECTS_ACCEL_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith((".zip", ".tmp")) and entry.stat().st_mtime < cutoff:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+async def _persist_project_zip(project_id: str, zip_chunks) -> None:
+    """Write the project ZIP into PROJECTS_ACCEL_DIR for nginx to serve"""
+    zip_path = os.path.join(PROJECTS_ACCEL_DIR, f"{project_id}.zip")
+    if await asyncio.to_thread(_touch_project_zip, zip_path):
+        return
+    
+    # Disk I/O runs in the default executor so downloads don't stall the event loop
+    await asyncio.to_thread(os.makedirs, PROJECTS_ACCEL_DIR, exist_ok=True)
+    fd, tmp_path = await asyncio.to_thread(tempfile.mkstemp, dir=PROJECTS_ACCEL_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            async for chunk in zip_chunks:
+                await asyncio.to_thread(tmp_file.write, chunk)
+        await asyncio.to_thread(os.replace, tmp_path, zip_path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    
+    if PROJECTS_ACCEL_MAX_AGE:
+        await asyncio.to_thread(_evict_project_zips)
+
+async def _chain_chunks(head: List[bytes], rest):
+    """Replay already-read ZIP chunks, then continue with the remaining stream"""
+    for chunk in head:
+        yield chunk
+    async for chunk in rest:
+        yield chunk
+
 @app.get("/api/download-project/{project_id}")
-async def download_project(project_id: str):
+async def download_project(project_id: str, http_request: Request):
     """Download generated project as ZIP file"""
     try:
-        zip_data = await code_generator.get_project_zip(project_id)
+        zip_chunks = http_request.app.state.code_generator.iter_project_zip(project_id)
+        headers = {"Content-Disposition": f"attachment; filename=project_{project_id}.zip"}
         
-        return StreamingResponse(
-            io.BytesIO(zip_data),
-            media_type="application/zip",
-            headers={"Content-Disposition": f"attachment; filename=project_{project_id}.zip"}
-        )
+        if PROJECTS_ACCEL_DIR:
+            # Let nginx send the file; Python never touches the payload again
+            await _persist_project_zip(project_id, zip_chunks)
+            headers["X-Accel-Redirect"] = f"{PROJECTS_ACCEL_LOCATION}{project_id}.zip"
+            return Response(media_type="application/zip", headers=headers)
+        
+        # Most projects are a few dozen text files: send those in a single body
+        # and only fall back to chunked streaming for large archives
+        head = []
+        size = 0
+        async for chunk in zip_chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size > INLINE_ZIP_MAX_SIZE:
+                return StreamingResponse(
+                    _chain_chunks(head, zip_chunks),
+                    media_type="application/zip",
+                    headers=headers
+                )
+        
+        return Response(content=b"".join(head), media_type="application/zip", headers=headers)
     except ValueError as e:
         logger.error(f"Project not found: {project_id}")
         raise HTTPException(status_code=404, detail=str(e))
@@ -227,9 +345,9 @@ if os.path.exists("frontend/build"):
         if full_path.startswith("api/"):
             raise HTTPException(status_code=404, detail="API endpoint not found")
         
-        index_file = "frontend/build/index.html"
-        if os.path.exists(index_file):
-            return FileResponse(index_file)
+        index_path = _index_path()
+        if index_path:
+            return FileResponse(index_path)
         else:
             return {"message": "Frontend not built yet. Run 'npm run build' in the frontend directory."}
 
@@ -239,11 +357,15 @@ if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
     debug = os.getenv("DEBUG", "false").lower() == "true"
+    # Documents and generated projects are held in process memory, so only
+    # raise this when every worker can serve every request
+    workers = int(os.getenv("WORKERS", 1))
     
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
         reload=debug,
+        workers=workers,
         log_level="info"
     )
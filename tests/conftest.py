@@ -1,4 +1,31 @@
 import sys
 import os
 
+import pytest
+import pytest_asyncio
+
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest_asyncio.fixture(scope="session")
+async def app():
+    """FastAPI app with its lifespan entered once for the whole session."""
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        yield app
+
+
+@pytest_asyncio.fixture(scope="session")
+async def client(app):
+    """HTTP client bound to the FastAPI app, shared across the test session."""
+    from httpx import AsyncClient, ASGITransport
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as http_client:
+        yield http_client
+
+
+@pytest.fixture(scope="session")
+def code_generator(app):
+    """The app's own CodeGenerator, so generated projects are downloadable."""
+    return app.state.code_generator
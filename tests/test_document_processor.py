@@ -7,11 +7,37 @@ import io
 import os
 import pytest
 import hashlib
+import sqlite3
+import httpx
+import xxhash
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
 
 from backend.core.document_processor import DocumentProcessor
 
 
+def _pdf_with_text(text: str) -> bytes:
+    """Build a one-page PDF whose page shows the given text."""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF" % (len(objects) + 1, xref)
+    return pdf
+
+
 @pytest.fixture
 def processor():
     """Create a document processor with mocked ChromaDB and embeddings."""
@@ -24,6 +50,7 @@ def processor():
 
         # Mock embeddings
         mock_embed = MagicMock()
+        mock_embed.embed_documents.side_effect = lambda texts: [[0.1] * 1536 for _ in texts]
         mock_embeddings.return_value = mock_embed
 
         # Set environment variable for OpenAI
@@ -90,6 +117,38 @@ class TestTextExtraction:
             text = processor._extract_text_from_pdf(pdf_content)
             assert "PDF content here" in text
 
+    def test_extract_text_from_pdf_file_is_memory_mapped(self, processor, tmp_path):
+        import mmap
+
+        pdf_path = tmp_path / "doc.pdf"
+        pdf_path.write_bytes(b"%PDF-1.4\n1 0 obj\n<< /Type /Catalog >>\nendobj\n%%EOF")
+        with patch('backend.core.document_processor.pypdf.PdfReader') as mock_reader, \
+             open(pdf_path, 'rb') as pdf_file:
+            mock_page = MagicMock()
+            mock_page.extract_text.return_value = "Mapped PDF content"
+            mock_reader.return_value.pages = [mock_page]
+
+            text = processor._extract_text_from_pdf(pdf_file)
+
+        assert "Mapped PDF content" in text
+        assert isinstance(mock_reader.call_args[0][0], mmap.mmap)
+
+    def test_extract_text_from_pdf_keeps_spooled_upload_in_memory(self, processor):
+        import tempfile
+
+        spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        spooled.write(b"%PDF-1.4\n%%EOF")
+        with patch('backend.core.document_processor.pypdf.PdfReader') as mock_reader:
+            mock_page = MagicMock()
+            mock_page.extract_text.return_value = "Spooled PDF content"
+            mock_reader.return_value.pages = [mock_page]
+
+            text = processor._extract_text_from_pdf(spooled)
+
+        assert "Spooled PDF content" in text
+        assert mock_reader.call_args[0][0] is spooled
+        assert not spooled._rolled
+
     def test_extract_text_from_markdown(self, processor):
         md_content = b"# Heading\n\nThis is **bold** text."
         text = processor._extract_text_from_markdown(md_content)
@@ -102,6 +161,27 @@ class TestTextExtraction:
         assert "Title" in text
         assert "Link" in text
 
+    def test_extract_text_from_markdown_decodes_html_and_entities(self, processor):
+        md_content = b'<div class="note">Some <b>HTML</b> block</div>\n\nFish &amp; chips &copy; <i>now</i>'
+        text = processor._extract_text_from_markdown(md_content)
+        assert "Some HTML block" in text
+        assert "Fish & chips \u00a9 now" in text
+        assert "<" not in text
+        assert "&amp;" not in text
+
+    def test_extract_text_from_markdown_keeps_code_span_characters(self, processor):
+        md_content = b"Return a `List<String>` when `a && b` holds"
+        text = processor._extract_text_from_markdown(md_content)
+        assert "Return a List<String> when a && b holds" in text
+
+    def test_extract_text_from_markdown_without_mistune(self, processor):
+        md_content = b"# Title\n\nFish &amp; <span>chips</span>"
+        with patch('backend.core.document_processor._markdown_ast', None):
+            text = processor._extract_text_from_markdown(md_content)
+        assert "Title" in text
+        assert "Fish & chips" in text
+        assert "<span>" not in text
+
     def test_extract_text_from_file_pdf(self, processor):
         with patch.object(processor, '_extract_text_from_pdf', return_value="PDF text"):
             text = processor._extract_text_from_file(b"content", "file.pdf")
@@ -137,30 +217,27 @@ class TestTextExtraction:
 class TestURLProcessing:
     """Test URL processing functionality."""
 
-    @pytest.mark.asyncio
     async def test_process_url_generates_doc_id(self, processor):
         url = "https://example.com/docs"
-        expected_id = hashlib.md5(url.encode()).hexdigest()
+        expected_id = xxhash.xxh3_64(url.encode()).hexdigest()
 
-        # Mock requests.get
-        with patch('backend.core.document_processor.requests.get') as mock_get:
-            mock_response = MagicMock()
-            mock_response.content = b"<html><body>Content</body></html>"
-            mock_response.raise_for_status = MagicMock()
-            mock_get.return_value = mock_response
+        def handler(request):
+            return httpx.Response(200, content=b"<html><body>Content</body></html>")
 
-            # Mock collection operations
-            mock_collection = MagicMock()
-            processor.chroma_client.get_or_create_collection.return_value = mock_collection
-            processor.chroma_client.list_collections.return_value = []
+        processor._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
 
-            doc_id = await processor.process_url(url)
-            assert doc_id == expected_id
+        # Mock collection operations
+        mock_collection = MagicMock()
+        processor.chroma_client.get_or_create_collection.return_value = mock_collection
+        processor.chroma_client.list_collections.return_value = []
+
+        doc_id = await processor.process_url(url)
+        assert doc_id == expected_id
+        assert "Content" in processor.document_index[doc_id]["preview"]
 
-    @pytest.mark.asyncio
     async def test_process_url_already_processed(self, processor):
         url = "https://example.com/docs"
-        doc_id = hashlib.md5(url.encode()).hexdigest()
+        doc_id = xxhash.xxh3_64(url.encode()).hexdigest()
 
         # Mock that document is already processed
         mock_collection = MagicMock()
@@ -170,21 +247,30 @@ class TestURLProcessing:
         result = await processor.process_url(url)
         assert result == doc_id
 
-    @pytest.mark.asyncio
     async def test_process_url_handles_http_error(self, processor):
         url = "https://example.com/notfound"
 
-        with patch('backend.core.document_processor.requests.get') as mock_get:
-            mock_get.side_effect = Exception("404 Not Found")
+        def handler(request):
+            return httpx.Response(404, content=b"Not Found")
+
+        processor._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        processor.chroma_client.list_collections.return_value = []
+
+        with pytest.raises(httpx.HTTPStatusError):
+            await processor.process_url(url)
+
+    async def test_aclose_closes_http_client(self, processor):
+        client = processor._get_http_client()
 
-            with pytest.raises(Exception):
-                await processor.process_url(url)
+        await processor.aclose()
+
+        assert client.is_closed
+        assert processor._http is None
 
 
 class TestFileProcessing:
     """Test file processing functionality."""
 
-    @pytest.mark.asyncio
     async def test_process_file_generates_doc_id(self, processor):
         content = b"File content here"
         filename = "test.txt"
@@ -198,7 +284,6 @@ class TestFileProcessing:
         doc_id = await processor.process_file(content, filename)
         assert doc_id == expected_id
 
-    @pytest.mark.asyncio
     async def test_process_file_already_processed(self, processor):
         content = b"File content"
         filename = "test.txt"
@@ -212,7 +297,6 @@ class TestFileProcessing:
         result = await processor.process_file(content, filename)
         assert result == doc_id
 
-    @pytest.mark.asyncio
     async def test_process_file_extracts_text(self, processor):
         content = b"# Markdown Content\n\nParagraph text."
         filename = "test.md"
@@ -225,11 +309,53 @@ class TestFileProcessing:
             await processor.process_file(content, filename)
             mock_extract.assert_called_once_with(content, filename)
 
+    async def test_process_file_object_is_extracted_in_process(self, processor):
+        import concurrent.futures
+
+        mock_collection = MagicMock()
+        processor.chroma_client.get_or_create_collection.return_value = mock_collection
+        processor.chroma_client.list_collections.return_value = []
+        processor._cpu_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        upload = io.BytesIO(b"File-backed content")
+
+        try:
+            with patch.object(processor, '_extract_text_from_file', return_value="Extracted") as mock_extract:
+                await processor.process_file(upload, "notes.txt")
+        finally:
+            processor._cpu_pool.shutdown()
+
+        # The file object itself is extracted; no bytes copy is shipped to the pool
+        mock_extract.assert_called_once_with(upload, "notes.txt")
+
+    async def test_process_file_extracts_pdf_upload_in_cpu_pool(self, processor):
+        import concurrent.futures
+        import multiprocessing
+        import tempfile
+
+        processor._cpu_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("forkserver")
+        )
+        mock_collection = MagicMock()
+        processor.chroma_client.get_or_create_collection.return_value = mock_collection
+        processor.chroma_client.list_collections.return_value = []
+        # The same file object the upload endpoint passes in (UploadFile.file)
+        upload = tempfile.SpooledTemporaryFile()
+        upload.write(_pdf_with_text("Pooled PDF text"))
+
+        try:
+            with patch.object(processor, '_extract_text_from_file') as mock_extract:
+                await processor.process_file(upload, "pooled.pdf")
+        finally:
+            processor._cpu_pool.shutdown()
+            upload.close()
+
+        mock_extract.assert_not_called()
+        assert "Pooled PDF text" in mock_collection.add.call_args[1]["documents"][0]
+
 
 class TestDocumentStorage:
     """Test document storage and indexing."""
 
-    @pytest.mark.asyncio
     async def test_process_and_store_creates_collection(self, processor):
         doc_id = "test123"
         text_content = "Short text content"
@@ -243,7 +369,6 @@ class TestDocumentStorage:
         call_args = processor.chroma_client.get_or_create_collection.call_args
         assert call_args[1]['name'] == f"doc_{doc_id}"
 
-    @pytest.mark.asyncio
     async def test_process_and_store_adds_to_index(self, processor):
         doc_id = "test123"
         text_content = "Content for testing"
@@ -257,21 +382,52 @@ class TestDocumentStorage:
         assert processor.document_index[doc_id]['doc_id'] == doc_id
         assert processor.document_index[doc_id]['source_type'] == 'file'
 
-    @pytest.mark.asyncio
     async def test_process_and_store_with_embeddings(self, processor):
         doc_id = "test123"
         text_content = "A" * 2000  # Long enough to create multiple chunks
 
         mock_collection = MagicMock()
         processor.chroma_client.get_or_create_collection.return_value = mock_collection
-        processor.embeddings.embed_query = Mock(return_value=[0.1] * 1536)
 
         await processor._process_and_store(doc_id, text_content, filename="test.txt")
 
         # Should have called add on collection
         assert mock_collection.add.called
+        assert len(mock_collection.add.call_args[1]['embeddings']) == len(mock_collection.add.call_args[1]['ids'])
+
+    async def test_concurrent_stores_share_embedding_batch(self, processor):
+        import asyncio
+
+        processor.chroma_client.get_or_create_collection.return_value = MagicMock()
+
+        await asyncio.gather(
+            processor._process_and_store("doc_a", "First document", filename="a.txt"),
+            processor._process_and_store("doc_b", "Second document", filename="b.txt"),
+        )
+
+        processor.embeddings.embed_documents.assert_called_once()
+        assert sorted(processor.embeddings.embed_documents.call_args[0][0]) == ["First document", "Second document"]
+
+    async def test_embedding_batch_tasks_are_referenced_until_done(self):
+        import asyncio
+        from backend.core.document_processor import EmbeddingBatcher
+
+        batcher = EmbeddingBatcher(lambda texts: [[0.5] for _ in texts], max_batch_size=1)
+        pending = asyncio.ensure_future(batcher.embed("chunk"))
+        await asyncio.sleep(0)
+        assert len(batcher._tasks) == 1
+
+        assert await pending == [0.5]
+        await asyncio.sleep(0)
+        assert not batcher._tasks
+
+    async def test_embedding_batch_failure_propagates(self, processor):
+        processor.chroma_client.get_or_create_collection.return_value = MagicMock()
+        processor.embeddings.embed_documents.side_effect = Exception("Rate limited")
+
+        with pytest.raises(Exception, match="Rate limited"):
+            await processor._process_and_store("doc_a", "Some text", filename="a.txt")
 
-    @pytest.mark.asyncio
     async def test_process_and_store_without_embeddings(self, processor):
         doc_id = "test123"
         text_content = "Short content"
@@ -286,10 +442,61 @@ class TestDocumentStorage:
         assert mock_collection.add.called
 
 
+class TestBulkMode:
+    """Test SQLite PRAGMA handling during bulk inserts."""
+
+    def test_bulk_mode_applies_and_restores_pragmas(self, processor):
+        conn = processor.chroma_client._server._sysdb._conn_pool.connect.return_value
+        conn.execute.return_value.fetchone.return_value = ["previous"]
+
+        with processor._bulk_mode():
+            executed = [c.args[0] for c in conn.execute.call_args_list]
+            assert "PRAGMA synchronous=OFF" in executed
+            assert "PRAGMA journal_mode=MEMORY" in executed
+
+        executed = [c.args[0] for c in conn.execute.call_args_list]
+        assert executed[-2:] == ["PRAGMA locking_mode=previous", "SELECT 1 FROM sqlite_master LIMIT 1"]
+        processor.chroma_client._server._sysdb._conn_pool.return_to_pool.assert_called_once_with(conn)
+
+    def test_bulk_mode_tolerates_missing_connection(self, processor):
+        processor.chroma_client._server._sysdb._conn_pool.connect.side_effect = Exception("No pool")
+
+        with processor._bulk_mode():
+            pass
+
+    def test_bulk_mode_releases_exclusive_lock(self, processor, tmp_path):
+        db_path = str(tmp_path / "chroma.sqlite3")
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        conn.execute("CREATE TABLE chunks (id TEXT)")
+        pool = processor.chroma_client._server._sysdb._conn_pool
+        pool.connect.return_value = conn
+
+        with processor._bulk_mode():
+            conn.execute("INSERT INTO chunks VALUES ('bulk')")
+
+        other = sqlite3.connect(db_path, timeout=0)
+        try:
+            other.execute("INSERT INTO chunks VALUES ('other')")
+            other.commit()
+        finally:
+            other.close()
+            conn.close()
+
+    def test_bulk_mode_warns_once_when_unavailable(self, processor, caplog):
+        pool = processor.chroma_client._server._sysdb._conn_pool
+        pool.connect.side_effect = Exception("No pool")
+
+        for _ in range(3):
+            with processor._bulk_mode():
+                pass
+
+        assert pool.connect.call_count == 1
+        assert caplog.text.count("Bulk insert mode unavailable") == 1
+
+
 class TestDocumentQuerying:
     """Test document query functionality."""
 
-    @pytest.mark.asyncio
     async def test_query_documents_with_embeddings(self, processor):
         doc_id = "test123"
         query = "test query"
@@ -306,7 +513,6 @@ class TestDocumentQuerying:
         assert len(results) == 3
         assert results == ["chunk1", "chunk2", "chunk3"]
 
-    @pytest.mark.asyncio
     async def test_query_documents_without_embeddings(self, processor):
         doc_id = "test123"
         query = "test query"
@@ -325,7 +531,17 @@ class TestDocumentQuerying:
         # Should use query_texts instead of query_embeddings
         assert 'query_texts' in mock_collection.query.call_args[1]
 
-    @pytest.mark.asyncio
+    async def test_query_documents_caches_query_embedding(self, processor):
+        mock_collection = MagicMock()
+        mock_collection.query.return_value = {'documents': [["chunk1"]]}
+        processor.chroma_client.get_collection.return_value = mock_collection
+        processor.embeddings.embed_query = Mock(return_value=[0.1] * 1536)
+
+        await processor.query_documents("test123", "repeat query")
+        await processor.query_documents("test123", "repeat query")
+
+        processor.embeddings.embed_query.assert_called_once_with("repeat query")
+
     async def test_query_documents_handles_error(self, processor):
         doc_id = "test123"
         query = "test query"
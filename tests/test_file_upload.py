@@ -17,70 +17,137 @@ def processor():
 # --- File Validation (main.py helpers) ---
 
 class TestFileValidation:
-    def test_validate_upload_rejects_unsupported_extension(self):
-        from main import _validate_upload
+    def test_validate_extension_rejects_unsupported_extension(self):
+        from main import _validate_extension
         from fastapi import HTTPException
 
         with pytest.raises(HTTPException) as exc_info:
-            _validate_upload("file.exe", b"data")
+            _validate_extension("file.exe")
         assert exc_info.value.status_code == 400
         assert "Unsupported file type" in exc_info.value.detail
 
-    def test_validate_upload_rejects_oversized_file(self):
-        from main import _validate_upload, MAX_FILE_SIZE
+    def test_validate_size_rejects_oversized_file(self):
+        from main import _validate_size, MAX_FILE_SIZE
         from fastapi import HTTPException
 
-        big_content = b"x" * (MAX_FILE_SIZE + 1)
         with pytest.raises(HTTPException) as exc_info:
-            _validate_upload("file.txt", big_content)
+            _validate_size(MAX_FILE_SIZE + 1)
         assert exc_info.value.status_code == 400
         assert "exceeds maximum" in exc_info.value.detail
 
-    def test_validate_upload_accepts_pdf(self):
-        from main import _validate_upload
+    def test_validate_extension_rejects_missing_extension(self):
+        from main import _validate_extension
+        from fastapi import HTTPException
+
+        with pytest.raises(HTTPException) as exc_info:
+            _validate_extension("Makefile")
+        assert "Unsupported file type ''" in exc_info.value.detail
+
+    def test_validate_extension_is_case_insensitive(self):
+        from main import _validate_extension
+        _validate_extension("archive.v2.PDF")
+
+    def test_validate_size_accepts_limit(self):
+        from main import _validate_size, MAX_FILE_SIZE
         # Should not raise
-        _validate_upload("doc.pdf", b"small content")
+        _validate_size(MAX_FILE_SIZE)
+
+    def test_validate_extension_accepts_pdf(self):
+        from main import _validate_extension
+        # Should not raise
+        _validate_extension("doc.pdf")
+
+    def test_validate_extension_accepts_markdown(self):
+        from main import _validate_extension
+        _validate_extension("readme.md")
+
+    def test_validate_extension_accepts_txt(self):
+        from main import _validate_extension
+        _validate_extension("notes.txt")
+
+    def test_validate_extension_accepts_html(self):
+        from main import _validate_extension
+        _validate_extension("page.html")
+
+    def test_validate_extension_accepts_rst(self):
+        from main import _validate_extension
+        _validate_extension("docs.rst")
+
+    def test_validate_extension_accepts_docx(self):
+        from main import _validate_extension
+        _validate_extension("report.docx")
+
+    def test_validate_extension_accepts_htm(self):
+        from main import _validate_extension
+        _validate_extension("page.htm")
+
+    def test_validate_extension_accepts_markdown_long_ext(self):
+        from main import _validate_extension
+        _validate_extension("readme.markdown")
+
+    async def test_check_upload_stops_at_size_limit(self, monkeypatch):
+        import main
+        from fastapi import HTTPException, UploadFile
+
+        monkeypatch.setattr(main, "MAX_FILE_SIZE", 100)
+        monkeypatch.setattr(main, "UPLOAD_READ_CHUNK_SIZE", 10)
+        upload = UploadFile(io.BytesIO(b"x" * 1000), filename="big.txt")
+
+        with pytest.raises(HTTPException) as exc_info:
+            await main._check_upload(upload)
+        assert "exceeds maximum" in exc_info.value.detail
+        assert upload.file.tell() <= 110
 
-    def test_validate_upload_accepts_markdown(self):
-        from main import _validate_upload
-        _validate_upload("readme.md", b"# Hello")
+    async def test_check_upload_rejects_extension_before_reading(self):
+        from main import _check_upload
+        from fastapi import HTTPException, UploadFile
 
-    def test_validate_upload_accepts_txt(self):
-        from main import _validate_upload
-        _validate_upload("notes.txt", b"plain text")
+        upload = UploadFile(io.BytesIO(b"data"), filename="file.exe")
+        with pytest.raises(HTTPException):
+            await _check_upload(upload)
+        assert upload.file.tell() == 0
 
-    def test_validate_upload_accepts_html(self):
-        from main import _validate_upload
-        _validate_upload("page.html", b"<html></html>")
+    async def test_check_upload_rewinds_valid_file(self):
+        from main import _check_upload
+        from fastapi import UploadFile
 
-    def test_validate_upload_accepts_rst(self):
-        from main import _validate_upload
-        _validate_upload("docs.rst", b"Title\n=====")
+        upload = UploadFile(io.BytesIO(b"valid content"), filename="notes.txt")
+        await _check_upload(upload)
+        assert upload.file.read() == b"valid content"
 
-    def test_validate_upload_accepts_docx(self):
-        from main import _validate_upload
-        _validate_upload("report.docx", b"PK")
+    async def test_check_upload_uses_known_size_without_reading(self, monkeypatch):
+        import main
+        from fastapi import HTTPException, UploadFile
 
-    def test_validate_upload_accepts_htm(self):
-        from main import _validate_upload
-        _validate_upload("page.htm", b"<html></html>")
+        monkeypatch.setattr(main, "MAX_FILE_SIZE", 10)
+        upload = UploadFile(io.BytesIO(b"x" * 100), filename="big.txt", size=100)
+        with pytest.raises(HTTPException) as exc_info:
+            await main._check_upload(upload)
+        assert "exceeds maximum" in exc_info.value.detail
+        assert upload.file.tell() == 0
+
+    async def test_check_upload_rejects_empty_file(self):
+        from main import _check_upload
+        from fastapi import HTTPException, UploadFile
 
-    def test_validate_upload_accepts_markdown_long_ext(self):
-        from main import _validate_upload
-        _validate_upload("readme.markdown", b"# Hello")
+        for upload in (
+            UploadFile(io.BytesIO(b""), filename="empty.txt"),
+            UploadFile(io.BytesIO(b""), filename="empty.txt", size=0),
+        ):
+            with pytest.raises(HTTPException) as exc_info:
+                await _check_upload(upload)
+            assert exc_info.value.detail == "File is empty"
 
 
 # --- Simplified Document Processor: Text Extraction ---
 
 class TestSimplifiedProcessorExtraction:
-    @pytest.mark.asyncio
     async def test_process_txt_file(self, processor):
         content = b"Hello, this is a text document."
         doc_id = await processor.process_file(content, "test.txt")
         assert doc_id
         assert processor.processed_docs[doc_id]["content"] == "Hello, this is a text document."
 
-    @pytest.mark.asyncio
     async def test_document_summary_contains_preview(self, processor):
         content = b"Heading\n\nThis is enough content to build a preview."
         doc_id = await processor.process_file(content, "guide.txt")
@@ -92,7 +159,6 @@ class TestSimplifiedProcessorExtraction:
         assert summary["char_count"] == len(content.decode())
         assert "preview" in summary
 
-    @pytest.mark.asyncio
     async def test_process_markdown_file(self, processor):
         content = b"# Title\n\nThis is **bold** text."
         doc_id = await processor.process_file(content, "readme.md")
@@ -102,7 +168,6 @@ class TestSimplifiedProcessorExtraction:
         assert "Title" in extracted
         assert "bold" in extracted
 
-    @pytest.mark.asyncio
     async def test_process_html_file(self, processor):
         content = b"<html><body><h1>Hello</h1><p>World</p></body></html>"
         doc_id = await processor.process_file(content, "page.html")
@@ -111,7 +176,6 @@ class TestSimplifiedProcessorExtraction:
         assert "Hello" in extracted
         assert "World" in extracted
 
-    @pytest.mark.asyncio
     async def test_process_rst_file(self, processor):
         content = b"Title\n=====\n\nParagraph text."
         doc_id = await processor.process_file(content, "docs.rst")
@@ -120,24 +184,41 @@ class TestSimplifiedProcessorExtraction:
         assert "Title" in extracted
         assert "Paragraph text." in extracted
 
-    @pytest.mark.asyncio
     async def test_file_size_stored(self, processor):
         content = b"Some content here"
         doc_id = await processor.process_file(content, "test.txt")
         assert processor.processed_docs[doc_id]["file_size"] == len(content)
 
-    @pytest.mark.asyncio
+    async def test_process_file_object_matches_bytes(self, processor):
+        content = b"# Title\n\nFile-backed upload."
+        id_from_bytes = await processor.process_file(content, "readme.md")
+        id_from_file = await processor.process_file(io.BytesIO(content), "readme.md")
+        assert id_from_file == id_from_bytes
+        assert processor.processed_docs[id_from_file]["file_size"] == len(content)
+        assert "File-backed upload." in processor.processed_docs[id_from_file]["content"]
+
     async def test_duplicate_file_returns_same_id(self, processor):
         content = b"Same content"
         id1 = await processor.process_file(content, "file1.txt")
         id2 = await processor.process_file(content, "file2.txt")
         assert id1 == id2
 
+    async def test_processed_docs_evicts_least_recently_used(self, monkeypatch):
+        monkeypatch.setenv("DOC_CACHE", "2")
+        processor = DocumentProcessor()
+        first = await processor.process_file(b"First", "first.txt")
+        second = await processor.process_file(b"Second", "second.txt")
+        processor.get_document_summary(first)
+        third = await processor.process_file(b"Third", "third.txt")
+
+        assert first in processor.processed_docs
+        assert third in processor.processed_docs
+        assert second not in processor.processed_docs
+
 
 # --- Simplified Document Processor: Query with Real Content ---
 
 class TestSimplifiedProcessorQuery:
-    @pytest.mark.asyncio
     async def test_query_returns_real_chunks(self, processor):
         # Create content large enough to be chunked
         words = " ".join([f"word{i}" for i in range(200)])
@@ -148,13 +229,11 @@ class TestSimplifiedProcessorQuery:
         # Chunks should contain actual content, not simulated placeholders
         assert all("word" in chunk for chunk in chunks)
 
-    @pytest.mark.asyncio
     async def test_query_url_returns_simulated(self, processor):
         doc_id = await processor.process_url("https://example.com")
         chunks = await processor.query_documents(doc_id, "test query", n_results=3)
         assert len(chunks) > 0
 
-    @pytest.mark.asyncio
     async def test_query_missing_doc_returns_empty(self, processor):
         chunks = await processor.query_documents("nonexistent", "query")
         assert chunks == []
@@ -163,84 +242,54 @@ class TestSimplifiedProcessorQuery:
 # --- Upload Endpoints ---
 
 class TestUploadEndpoint:
-    @pytest.mark.asyncio
-    async def test_single_upload_txt(self):
-        from httpx import AsyncClient, ASGITransport
-        from main import app
-
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/api/upload-documentation",
-                files={"file": ("test.txt", b"Hello world", "text/plain")},
-            )
+    async def test_single_upload_txt(self, client):
+        response = await client.post(
+            "/api/upload-documentation",
+            files={"file": ("test.txt", b"Hello world", "text/plain")},
+        )
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "success"
         assert "doc_id" in data
 
-    @pytest.mark.asyncio
-    async def test_single_upload_markdown(self):
-        from httpx import AsyncClient, ASGITransport
-        from main import app
-
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/api/upload-documentation",
-                files={"file": ("readme.md", b"# Hello\nWorld", "text/markdown")},
-            )
+    async def test_single_upload_markdown(self, client):
+        response = await client.post(
+            "/api/upload-documentation",
+            files={"file": ("readme.md", b"# Hello\nWorld", "text/markdown")},
+        )
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "success"
 
-    @pytest.mark.asyncio
-    async def test_single_upload_rejects_bad_extension(self):
-        from httpx import AsyncClient, ASGITransport
-        from main import app
-
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/api/upload-documentation",
-                files={"file": ("malware.exe", b"bad content", "application/octet-stream")},
-            )
+    async def test_single_upload_rejects_bad_extension(self, client):
+        response = await client.post(
+            "/api/upload-documentation",
+            files={"file": ("malware.exe", b"bad content", "application/octet-stream")},
+        )
         assert response.status_code == 400
 
-    @pytest.mark.asyncio
-    async def test_multiple_upload(self):
-        from httpx import AsyncClient, ASGITransport
-        from main import app
-
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/api/upload-multiple-documentation",
-                files=[
-                    ("files", ("doc1.txt", b"First document", "text/plain")),
-                    ("files", ("doc2.md", b"# Second", "text/markdown")),
-                ],
-            )
+    async def test_multiple_upload(self, client):
+        response = await client.post(
+            "/api/upload-multiple-documentation",
+            files=[
+                ("files", ("doc1.txt", b"First document", "text/plain")),
+                ("files", ("doc2.md", b"# Second", "text/markdown")),
+            ],
+        )
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "success"
         assert len(data["results"]) == 2
         assert len(data["errors"]) == 0
 
-    @pytest.mark.asyncio
-    async def test_multiple_upload_partial_failure(self):
-        from httpx import AsyncClient, ASGITransport
-        from main import app
-
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.post(
-                "/api/upload-multiple-documentation",
-                files=[
-                    ("files", ("good.txt", b"Good content", "text/plain")),
-                    ("files", ("bad.exe", b"Bad content", "application/octet-stream")),
-                ],
-            )
+    async def test_multiple_upload_partial_failure(self, client):
+        response = await client.post(
+            "/api/upload-multiple-documentation",
+            files=[
+                ("files", ("good.txt", b"Good content", "text/plain")),
+                ("files", ("bad.exe", b"Bad content", "application/octet-stream")),
+            ],
+        )
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "partial"
@@ -251,14 +300,8 @@ class TestUploadEndpoint:
 # --- Supported Formats Endpoint ---
 
 class TestSupportedFormatsEndpoint:
-    @pytest.mark.asyncio
-    async def test_returns_formats(self):
-        from httpx import AsyncClient, ASGITransport
-        from main import app
-
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.get("/api/supported-formats")
+    async def test_returns_formats(self, client):
+        response = await client.get("/api/supported-formats")
         assert response.status_code == 200
         data = response.json()
         assert ".pdf" in data["formats"]
@@ -269,21 +312,34 @@ class TestSupportedFormatsEndpoint:
         assert data["max_file_size_mb"] == 50
 
 
-class TestDocumentSummaryEndpoint:
-    @pytest.mark.asyncio
-    async def test_returns_summary_for_processed_file(self):
-        from httpx import AsyncClient, ASGITransport
-        from main import app
-
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            upload_response = await client.post(
-                "/api/upload-documentation",
-                files={"file": ("notes.txt", b"Implementation details for a demo app", "text/plain")},
+class TestCorsPreflight:
+    async def test_allows_dev_frontend_origins(self, client):
+        for origin in ("http://localhost:3000", "http://127.0.0.1:3000"):
+            response = await client.options(
+                "/api/supported-formats",
+                headers={"Origin": origin, "Access-Control-Request-Method": "GET"},
             )
-            doc_id = upload_response.json()["doc_id"]
+            assert response.status_code == 200
+            assert response.headers["access-control-allow-origin"] == origin
+
+    async def test_rejects_other_origins(self, client):
+        response = await client.options(
+            "/api/supported-formats",
+            headers={"Origin": "http://localhost:3000.evil.com", "Access-Control-Request-Method": "GET"},
+        )
+        assert response.status_code == 400
+        assert "access-control-allow-origin" not in response.headers
 
-            summary_response = await client.get(f"/api/documents/{doc_id}")
+
+class TestDocumentSummaryEndpoint:
+    async def test_returns_summary_for_processed_file(self, client):
+        upload_response = await client.post(
+            "/api/upload-documentation",
+            files={"file": ("notes.txt", b"Implementation details for a demo app", "text/plain")},
+        )
+        doc_id = upload_response.json()["doc_id"]
+
+        summary_response = await client.get(f"/api/documents/{doc_id}")
 
         assert summary_response.status_code == 200
         data = summary_response.json()
@@ -292,13 +348,7 @@ class TestDocumentSummaryEndpoint:
         assert data["source_type"] == "file"
         assert data["char_count"] > 0
 
-    @pytest.mark.asyncio
-    async def test_missing_document_returns_not_found(self):
-        from httpx import AsyncClient, ASGITransport
-        from main import app
-
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.get("/api/documents/missing-doc")
+    async def test_missing_document_returns_not_found(self, client):
+        response = await client.get("/api/documents/missing-doc")
 
         assert response.status_code == 404
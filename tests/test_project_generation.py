@@ -37,7 +37,6 @@ class TestTechnologyDetection:
 # --- Spring Boot Generation ---
 
 class TestSpringBootGeneration:
-    @pytest.mark.asyncio
     async def test_generates_valid_response(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Spring Boot REST API", technology=Technology.SPRING_BOOT
@@ -47,7 +46,6 @@ class TestSpringBootGeneration:
         assert len(result.files) > 0
         assert result.instructions
 
-    @pytest.mark.asyncio
     async def test_contains_required_files(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Spring Boot REST API", technology=Technology.SPRING_BOOT
@@ -59,7 +57,6 @@ class TestSpringBootGeneration:
         assert "src/main/resources/application.properties" in file_names
         assert "README.md" in file_names
 
-    @pytest.mark.asyncio
     async def test_pom_has_spring_boot_dependency(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Spring Boot REST API", technology=Technology.SPRING_BOOT
@@ -68,7 +65,6 @@ class TestSpringBootGeneration:
         assert "spring-boot-starter-web" in pom.content
         assert "spring-boot-starter-parent" in pom.content
 
-    @pytest.mark.asyncio
     async def test_conditional_jpa_dependency(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Spring Boot app with JPA database", technology=Technology.SPRING_BOOT
@@ -76,7 +72,6 @@ class TestSpringBootGeneration:
         pom = next(f for f in result.files if f.name == "pom.xml")
         assert "spring-boot-starter-data-jpa" in pom.content
 
-    @pytest.mark.asyncio
     async def test_structure_has_correct_nesting(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Spring Boot REST API", technology=Technology.SPRING_BOOT
@@ -88,7 +83,6 @@ class TestSpringBootGeneration:
 # --- Django Generation ---
 
 class TestDjangoGeneration:
-    @pytest.mark.asyncio
     async def test_generates_valid_response(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Django web app", technology=Technology.DJANGO
@@ -98,7 +92,6 @@ class TestDjangoGeneration:
         assert len(result.files) > 0
         assert result.instructions
 
-    @pytest.mark.asyncio
     async def test_contains_required_files(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Django web app", technology=Technology.DJANGO
@@ -115,7 +108,6 @@ class TestDjangoGeneration:
         assert "core/urls.py" in file_names
         assert "manage.py" in file_names
 
-    @pytest.mark.asyncio
     async def test_settings_has_correct_module_ref(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Django web app", technology=Technology.DJANGO
@@ -123,7 +115,6 @@ class TestDjangoGeneration:
         settings = next(f for f in result.files if f.name == "django_app/settings.py")
         assert "django_app.urls" in settings.content or "ROOT_URLCONF" in settings.content
 
-    @pytest.mark.asyncio
     async def test_manage_py_references_settings(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Django web app", technology=Technology.DJANGO
@@ -131,7 +122,6 @@ class TestDjangoGeneration:
         manage = next(f for f in result.files if f.name == "manage.py")
         assert "django_app.settings" in manage.content
 
-    @pytest.mark.asyncio
     async def test_requirements_has_django(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Django web app", technology=Technology.DJANGO
@@ -139,7 +129,6 @@ class TestDjangoGeneration:
         req = next(f for f in result.files if f.name == "requirements.txt")
         assert "Django" in req.content
 
-    @pytest.mark.asyncio
     async def test_conditional_drf_dependency(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Django REST API", technology=Technology.DJANGO
@@ -147,7 +136,6 @@ class TestDjangoGeneration:
         req = next(f for f in result.files if f.name == "requirements.txt")
         assert "djangorestframework" in req.content
 
-    @pytest.mark.asyncio
     async def test_structure_includes_init_py(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Django web app", technology=Technology.DJANGO
@@ -158,7 +146,6 @@ class TestDjangoGeneration:
 # --- React Generation ---
 
 class TestReactGeneration:
-    @pytest.mark.asyncio
     async def test_generates_valid_response(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Build a React dashboard", technology=Technology.REACT
@@ -168,7 +155,6 @@ class TestReactGeneration:
         assert len(result.files) > 0
         assert result.instructions
 
-    @pytest.mark.asyncio
     async def test_contains_required_files(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Build a React dashboard", technology=Technology.REACT
@@ -181,7 +167,6 @@ class TestReactGeneration:
         assert "tsconfig.json" in file_names
         assert "README.md" in file_names
 
-    @pytest.mark.asyncio
     async def test_package_json_has_react(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Build a React dashboard", technology=Technology.REACT
@@ -190,7 +175,6 @@ class TestReactGeneration:
         assert '"react"' in pkg.content
         assert '"react-dom"' in pkg.content
 
-    @pytest.mark.asyncio
     async def test_conditional_axios_dependency(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="React app with API integration", technology=Technology.REACT
@@ -198,7 +182,6 @@ class TestReactGeneration:
         pkg = next(f for f in result.files if f.name == "package.json")
         assert "axios" in pkg.content
 
-    @pytest.mark.asyncio
     async def test_tsconfig_has_jsx_support(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Build a React dashboard", technology=Technology.REACT
@@ -210,7 +193,6 @@ class TestReactGeneration:
 # --- ZIP Export ---
 
 class TestZipExport:
-    @pytest.mark.asyncio
     async def test_spring_boot_zip(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Spring Boot REST API", technology=Technology.SPRING_BOOT
@@ -219,7 +201,6 @@ class TestZipExport:
         assert isinstance(zip_data, bytes)
         assert len(zip_data) > 0
 
-    @pytest.mark.asyncio
     async def test_django_zip(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Django web app", technology=Technology.DJANGO
@@ -228,7 +209,6 @@ class TestZipExport:
         assert isinstance(zip_data, bytes)
         assert len(zip_data) > 0
 
-    @pytest.mark.asyncio
     async def test_react_zip(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Build a React dashboard", technology=Technology.REACT
@@ -237,7 +217,6 @@ class TestZipExport:
         assert isinstance(zip_data, bytes)
         assert len(zip_data) > 0
 
-    @pytest.mark.asyncio
     async def test_invalid_project_id_raises(self, generator):
         with pytest.raises(ValueError, match="Project not found"):
             await generator.get_project_zip("nonexistent-id")
@@ -246,7 +225,6 @@ class TestZipExport:
 # --- Auto-detection End-to-End ---
 
 class TestAutoDetection:
-    @pytest.mark.asyncio
     async def test_spring_boot_auto_detected(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Spring Boot REST API with CRUD operations"
@@ -254,7 +232,6 @@ class TestAutoDetection:
         file_names = [f.name for f in result.files]
         assert "pom.xml" in file_names
 
-    @pytest.mark.asyncio
     async def test_django_auto_detected(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Create a Django web application with models"
@@ -262,7 +239,6 @@ class TestAutoDetection:
         file_names = [f.name for f in result.files]
         assert "manage.py" in file_names
 
-    @pytest.mark.asyncio
     async def test_react_auto_detected(self, generator):
         result = await generator.generate_project(
             doc_id="test", prompt="Build a React dashboard with components"
@@ -4,244 +4,315 @@ Validates that Flask, Express, and Next.js project generation produces
 correct ZIP archives with expected file contents, and that the download
 endpoint returns valid ZIP responses.
 """
+import asyncio
+import base64
+import hashlib
 import io
+import os
 import zipfile
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
 
 import pytest
+import pytest_asyncio
 
-from backend.models.schemas import Technology, FileContent, GenerationResponse
+import main
+from backend.models import schemas
+from backend.models.schemas import Technology, GenerationResponse
+from backend.core import code_generator_simple
 from backend.core.code_generator_simple import CodeGenerator
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def generator():
     return CodeGenerator()
 
 
-# --- Flask Generation ---
-
-class TestFlaskGeneration:
-    @pytest.mark.asyncio
-    async def test_generates_valid_response(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Create a Flask REST API", technology=Technology.FLASK
-        )
+@pytest.fixture(autouse=True, scope="module")
+def _no_deflate():
+    """Store ZIP entries uncompressed; content checks don't depend on the method."""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(code_generator_simple, "ZIP_COMPRESSION", zipfile.ZIP_STORED)
+        yield
+
+
+class GeneratedProject(NamedTuple):
+    result: GenerationResponse
+    names: frozenset[str]
+    zip_data: bytes
+    # Every ZIP entry, read once
+    entries: dict[str, bytes]
+
+
+# Generated projects keyed by (technology, prompt), shared by every test in the module
+_PROJECTS: dict[tuple[Technology, str], GeneratedProject] = {}
+
+
+def _project_from(result: GenerationResponse, zip_data: bytes) -> GeneratedProject:
+    """Index a generated project's files and ZIP entries."""
+    with zipfile.ZipFile(io.BytesIO(zip_data), 'r') as zf:
+        entries = {name: zf.read(name) for name in zf.namelist()}
+    return GeneratedProject(result, frozenset(f.name for f in result.files), zip_data, entries)
+
+
+async def _gen(generator, prompt: str, technology: Technology) -> GeneratedProject:
+    """Generate a project and its ZIP once per (technology, prompt) and reuse them afterwards."""
+    key = (technology, prompt)
+    if key not in _PROJECTS:
+        result = await generator.generate_project(doc_id="test", prompt=prompt, technology=technology)
+        _PROJECTS[key] = _project_from(result, await generator.get_project_zip(result.project_id))
+    return _PROJECTS[key]
+
+
+# Editing the generator templates or the schemas changes every on-disk cache key
+_SOURCE_DIGEST = hashlib.sha256(
+    b"".join(Path(module.__file__).read_bytes() for module in (code_generator_simple, schemas))
+).hexdigest()
+
+
+def _disk_key(technology: Technology, prompt: str) -> str:
+    """pytest cache key for a generated project."""
+    raw = f"{_SOURCE_DIGEST}|{technology.value}|{prompt}".encode()
+    return f"zipgen/{hashlib.sha256(raw).hexdigest()}"
+
+
+# --- Project Generation ---
+
+FLASK_REQUIRED = frozenset({"requirements.txt", "app.py", "README.md"})
+EXPRESS_REQUIRED = frozenset({"package.json", "src/index.js", "src/routes/api.js", "README.md"})
+NEXTJS_REQUIRED = frozenset({
+    "package.json", "tsconfig.json", "src/app/layout.tsx", "src/app/page.tsx", "README.md",
+})
+
+
+class Framework(NamedTuple):
+    technology: Technology
+    prompt: str
+    required_files: frozenset[str]
+    marker_file: str
+    marker_content: Tuple[bytes, ...]
+    # (file name, expected substring); a None substring only requires the file to exist
+    conditional_assert: Tuple[str, Optional[str]]
+
+
+FRAMEWORKS = [
+    Framework(
+        Technology.FLASK, "Create a Flask REST API with database integration",
+        FLASK_REQUIRED,
+        "requirements.txt", (b"Flask",),
+        ("requirements.txt", "SQLAlchemy"),
+    ),
+    Framework(
+        Technology.EXPRESS, "Build an Express.js API with JWT auth",
+        EXPRESS_REQUIRED,
+        "package.json", (b'"express"', b'"cors"'),
+        ("package.json", "jsonwebtoken"),
+    ),
+    Framework(
+        Technology.NEXTJS, "Create a Next.js application with API routes",
+        NEXTJS_REQUIRED,
+        "package.json", (b'"next"', b'"react"'),
+        ("src/app/api/hello/route.ts", None),
+    ),
+]
+
+# Projects only inspected as finished archives; their results and ZIPs are reused
+# from the pytest cache across runs, while FRAMEWORKS are always generated fresh
+CACHED_PROMPTS = [
+    (Technology.SPRING_BOOT, "Create a Spring Boot REST API"),
+]
+
+# Every (technology, prompt) the tests generate, warmed concurrently up front
+WARM_PROMPTS = [*((fw.technology, fw.prompt) for fw in FRAMEWORKS), *CACHED_PROMPTS]
+
+
+@pytest_asyncio.fixture(autouse=True, scope="module")
+async def _warm_cache(generator, _no_deflate, pytestconfig):
+    """Generate every project and its ZIP in one batch before the tests run."""
+    cache = getattr(pytestconfig, "cache", None)
+    misses = []
+    for technology, prompt in CACHED_PROMPTS:
+        data = cache.get(_disk_key(technology, prompt), None) if cache is not None else None
+        if data is None:
+            misses.append((technology, prompt))
+            continue
+        result = GenerationResponse.model_validate(data["result"])
+        _PROJECTS[(technology, prompt)] = _project_from(result, base64.b64decode(data["zip"]))
+
+    await asyncio.gather(*(_gen(generator, prompt, technology) for technology, prompt in WARM_PROMPTS))
+
+    if cache is not None:
+        for technology, prompt in misses:
+            project = _PROJECTS[(technology, prompt)]
+            cache.set(_disk_key(technology, prompt), {
+                "result": project.result.model_dump(mode="json"),
+                "zip": base64.b64encode(project.zip_data).decode("ascii"),
+            })
+
+
+@pytest.mark.parametrize("framework", FRAMEWORKS, ids=lambda fw: fw.technology.value)
+class TestProjectGeneration:
+    async def test_generates_valid_response(self, generator, framework):
+        result = (await _gen(generator, framework.prompt, framework.technology)).result
         assert isinstance(result, GenerationResponse)
         assert result.project_id
         assert len(result.files) > 0
         assert result.instructions
 
-    @pytest.mark.asyncio
-    async def test_contains_required_files(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Create a Flask REST API", technology=Technology.FLASK
-        )
-        file_names = [f.name for f in result.files]
-        assert "requirements.txt" in file_names
-        assert "app.py" in file_names
-        assert "README.md" in file_names
-
-    @pytest.mark.asyncio
-    async def test_requirements_has_flask(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Create a Flask REST API", technology=Technology.FLASK
-        )
-        req = next(f for f in result.files if f.name == "requirements.txt")
-        assert "Flask" in req.content
+    async def test_contains_required_files(self, generator, framework):
+        names = (await _gen(generator, framework.prompt, framework.technology)).names
+        assert framework.required_files <= names, f"Missing {framework.required_files - names}"
 
-    @pytest.mark.asyncio
-    async def test_conditional_sqlalchemy_dependency(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Flask app with database integration", technology=Technology.FLASK
-        )
-        req = next(f for f in result.files if f.name == "requirements.txt")
-        assert "SQLAlchemy" in req.content
+    async def test_marker_file_has_framework(self, generator, framework):
+        entries = (await _gen(generator, framework.prompt, framework.technology)).entries
+        marker = entries[framework.marker_file]
+        for content in framework.marker_content:
+            assert content in marker
 
-
-# --- Express Generation ---
-
-class TestExpressGeneration:
-    @pytest.mark.asyncio
-    async def test_generates_valid_response(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Build an Express.js API", technology=Technology.EXPRESS
-        )
-        assert isinstance(result, GenerationResponse)
-        assert result.project_id
-        assert len(result.files) > 0
-        assert result.instructions
-
-    @pytest.mark.asyncio
-    async def test_contains_required_files(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Build an Express.js API", technology=Technology.EXPRESS
-        )
-        file_names = [f.name for f in result.files]
-        assert "package.json" in file_names
-        assert "src/index.js" in file_names
-        assert "src/routes/api.js" in file_names
-        assert "README.md" in file_names
-
-    @pytest.mark.asyncio
-    async def test_package_json_has_express(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Build an Express.js API", technology=Technology.EXPRESS
-        )
-        pkg = next(f for f in result.files if f.name == "package.json")
-        assert '"express"' in pkg.content
-        assert '"cors"' in pkg.content
-
-    @pytest.mark.asyncio
-    async def test_conditional_jwt_dependency(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Express API with JWT auth", technology=Technology.EXPRESS
-        )
-        pkg = next(f for f in result.files if f.name == "package.json")
-        assert "jsonwebtoken" in pkg.content
-
-
-# --- Next.js Generation ---
-
-class TestNextjsGeneration:
-    @pytest.mark.asyncio
-    async def test_generates_valid_response(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Create a Next.js application", technology=Technology.NEXTJS
-        )
-        assert isinstance(result, GenerationResponse)
-        assert result.project_id
-        assert len(result.files) > 0
-        assert result.instructions
-
-    @pytest.mark.asyncio
-    async def test_contains_required_files(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Create a Next.js application", technology=Technology.NEXTJS
-        )
-        file_names = [f.name for f in result.files]
-        assert "package.json" in file_names
-        assert "tsconfig.json" in file_names
-        assert "src/app/layout.tsx" in file_names
-        assert "src/app/page.tsx" in file_names
-        assert "README.md" in file_names
-
-    @pytest.mark.asyncio
-    async def test_package_json_has_next(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Create a Next.js application", technology=Technology.NEXTJS
-        )
-        pkg = next(f for f in result.files if f.name == "package.json")
-        assert '"next"' in pkg.content
-        assert '"react"' in pkg.content
-
-    @pytest.mark.asyncio
-    async def test_conditional_api_route(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Next.js app with API routes", technology=Technology.NEXTJS
-        )
-        file_names = [f.name for f in result.files]
-        assert "src/app/api/hello/route.ts" in file_names
+    async def test_conditional_feature(self, generator, framework):
+        entries = (await _gen(generator, framework.prompt, framework.technology)).entries
+        file_name, expected = framework.conditional_assert
+        assert file_name in entries, f"Missing {file_name}"
+        if expected is not None:
+            assert expected.encode() in entries[file_name]
 
 
 # --- ZIP Content Validation ---
 
 class TestZipContents:
-    @pytest.mark.asyncio
     async def test_flask_zip_contains_all_files(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Create a Flask REST API", technology=Technology.FLASK
-        )
-        zip_data = await generator.get_project_zip(result.project_id)
-        with zipfile.ZipFile(io.BytesIO(zip_data), 'r') as zf:
-            zip_names = zf.namelist()
-            for f in result.files:
-                assert f.name in zip_names, f"Missing {f.name} in ZIP"
+        project = await _gen(generator, "Create a Flask REST API with database integration", Technology.FLASK)
+        missing = project.names - project.entries.keys()
+        assert not missing, f"Missing {missing} in ZIP"
 
-    @pytest.mark.asyncio
     async def test_express_zip_contains_all_files(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Build an Express.js API", technology=Technology.EXPRESS
-        )
-        zip_data = await generator.get_project_zip(result.project_id)
-        with zipfile.ZipFile(io.BytesIO(zip_data), 'r') as zf:
-            zip_names = zf.namelist()
-            for f in result.files:
-                assert f.name in zip_names, f"Missing {f.name} in ZIP"
+        project = await _gen(generator, "Build an Express.js API with JWT auth", Technology.EXPRESS)
+        missing = project.names - project.entries.keys()
+        assert not missing, f"Missing {missing} in ZIP"
 
-    @pytest.mark.asyncio
     async def test_nextjs_zip_contains_all_files(self, generator):
-        result = await generator.generate_project(
-            doc_id="test", prompt="Create a Next.js application", technology=Technology.NEXTJS
-        )
-        zip_data = await generator.get_project_zip(result.project_id)
-        with zipfile.ZipFile(io.BytesIO(zip_data), 'r') as zf:
-            zip_names = zf.namelist()
-            for f in result.files:
-                assert f.name in zip_names, f"Missing {f.name} in ZIP"
+        project = await _gen(generator, "Create a Next.js application with API routes", Technology.NEXTJS)
+        missing = project.names - project.entries.keys()
+        assert not missing, f"Missing {missing} in ZIP"
 
-    @pytest.mark.asyncio
     async def test_zip_file_content_matches(self, generator):
         """Verify that file content inside the ZIP matches the generated content."""
-        result = await generator.generate_project(
-            doc_id="test", prompt="Create a Flask REST API", technology=Technology.FLASK
-        )
-        zip_data = await generator.get_project_zip(result.project_id)
-        with zipfile.ZipFile(io.BytesIO(zip_data), 'r') as zf:
-            for f in result.files:
-                content = zf.read(f.name).decode('utf-8')
-                assert content == f.content, f"Content mismatch for {f.name}"
-
-    @pytest.mark.asyncio
-    async def test_zip_is_valid_archive(self, generator):
-        """Verify the generated bytes form a valid ZIP archive."""
+        project = await _gen(generator, "Create a Flask REST API with database integration", Technology.FLASK)
+        expected = {f.name: f.content for f in project.result.files}
+        got = {name: project.entries[name].decode('utf-8') for name in expected if name in project.entries}
+        assert got == expected
+
+    async def test_zip_is_valid_archive(self, generator, monkeypatch):
+        """Verify the generated bytes form a valid, deflated ZIP archive."""
+        monkeypatch.setattr(code_generator_simple, "ZIP_COMPRESSION", zipfile.ZIP_DEFLATED)
         result = await generator.generate_project(
             doc_id="test", prompt="Build a React dashboard", technology=Technology.REACT
         )
         zip_data = await generator.get_project_zip(result.project_id)
         assert zipfile.is_zipfile(io.BytesIO(zip_data))
+        with zipfile.ZipFile(io.BytesIO(zip_data), 'r') as zf:
+            assert all(info.compress_type == zipfile.ZIP_DEFLATED for info in zf.infolist())
 
-    @pytest.mark.asyncio
     async def test_zip_file_count_matches(self, generator):
         """Verify the ZIP contains exactly the number of generated files."""
-        result = await generator.generate_project(
-            doc_id="test", prompt="Create a Spring Boot REST API", technology=Technology.SPRING_BOOT
-        )
-        zip_data = await generator.get_project_zip(result.project_id)
-        with zipfile.ZipFile(io.BytesIO(zip_data), 'r') as zf:
-            assert len(zf.namelist()) == len(result.files)
+        project = await _gen(generator, "Create a Spring Boot REST API", Technology.SPRING_BOOT)
+        # Duplicate names collapse in the mapping, so this also fails on repeated entries
+        assert len(project.entries) == len(project.result.files)
+
+    async def test_streamed_zip_matches_generated_files(self, generator):
+        """Verify the streamed ZIP chunks form an archive with every generated file."""
+        result = (await _gen(generator, "Create a Next.js application with API routes", Technology.NEXTJS)).result
+        chunks = [chunk async for chunk in generator.iter_project_zip(result.project_id)]
+        assert len(chunks) > 1
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks)), 'r') as zf:
+            for f in result.files:
+                assert zf.read(f.name).decode('utf-8') == f.content
+
+    async def test_streamed_zip_is_async_generator(self, generator):
+        """StreamingResponse offloads sync iterators to a threadpool; keep this async."""
+        import inspect
+
+        result = (await _gen(generator, "Create a Flask REST API with database integration", Technology.FLASK)).result
+        chunks = generator.iter_project_zip(result.project_id)
+        assert inspect.isasyncgen(chunks)
+        await chunks.aclose()
+
+    def test_streamed_zip_unknown_project_raises(self, generator):
+        with pytest.raises(ValueError, match="Project not found"):
+            generator.iter_project_zip("nonexistent-id")
 
 
 # --- Download Endpoint ---
 
 class TestDownloadEndpoint:
-    @pytest.mark.asyncio
-    async def test_download_returns_zip(self):
+    async def test_download_returns_zip(self, client, code_generator):
         """Test that the download endpoint returns a valid ZIP response."""
-        from httpx import AsyncClient, ASGITransport
-        from main import app, code_generator
-
         # Generate a project using the app's code_generator instance
         result = await code_generator.generate_project(
             doc_id="test", prompt="Create a Flask REST API", technology=Technology.FLASK
         )
 
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.get(f"/api/download-project/{result.project_id}")
+        response = await client.get(f"/api/download-project/{result.project_id}")
 
         assert response.status_code == 200
         assert response.headers["content-type"] == "application/zip"
         assert "attachment" in response.headers["content-disposition"]
         assert zipfile.is_zipfile(io.BytesIO(response.content))
 
-    @pytest.mark.asyncio
-    async def test_download_invalid_id_returns_not_found(self):
-        """Test that requesting a non-existent project returns 404."""
-        from httpx import AsyncClient, ASGITransport
-        from main import app
+    async def test_download_sends_small_zip_in_one_body(self, client, code_generator):
+        """Test that small projects are returned with a Content-Length instead of chunked."""
+        result = await code_generator.generate_project(
+            doc_id="test", prompt="Create a Flask REST API", technology=Technology.FLASK
+        )
+
+        response = await client.get(f"/api/download-project/{result.project_id}")
+
+        assert response.headers["content-length"] == str(len(response.content))
+
+    async def test_download_streams_large_zip(self, client, code_generator, monkeypatch):
+        """Test that archives over INLINE_ZIP_MAX_SIZE are streamed in full."""
+        monkeypatch.setattr(main, "INLINE_ZIP_MAX_SIZE", 0)
+        result = await code_generator.generate_project(
+            doc_id="test", prompt="Create a Flask REST API", technology=Technology.FLASK
+        )
+
+        response = await client.get(f"/api/download-project/{result.project_id}")
+
+        assert "content-length" not in response.headers
+        with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+            assert len(zf.namelist()) == len(result.files)
 
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            response = await client.get("/api/download-project/nonexistent-id")
+    async def test_download_uses_x_accel_redirect_when_configured(self, client, code_generator, tmp_path, monkeypatch):
+        """Test that downloads are handed to nginx when PROJECTS_ACCEL_DIR is set."""
+        monkeypatch.setattr(main, "PROJECTS_ACCEL_DIR", str(tmp_path))
+        result = await code_generator.generate_project(
+            doc_id="test", prompt="Create a Flask REST API", technology=Technology.FLASK
+        )
+
+        response = await client.get(f"/api/download-project/{result.project_id}")
+
+        assert response.status_code == 200
+        assert response.headers["x-accel-redirect"] == f"/internal/projects/{result.project_id}.zip"
+        assert response.content == b""
+        assert zipfile.is_zipfile(tmp_path / f"{result.project_id}.zip")
+
+    async def test_download_evicts_stale_persisted_zips(self, client, code_generator, tmp_path, monkeypatch):
+        """Test that persisting a new ZIP deletes ones not downloaded within PROJECTS_ACCEL_MAX_AGE."""
+        monkeypatch.setattr(main, "PROJECTS_ACCEL_DIR", str(tmp_path))
+        stale = tmp_path / "stale.zip"
+        stale.write_bytes(b"old")
+        os.utime(stale, (0, 0))
+        result = await code_generator.generate_project(
+            doc_id="test", prompt="Create a Flask REST API", technology=Technology.FLASK
+        )
+
+        await client.get(f"/api/download-project/{result.project_id}")
+
+        assert not stale.exists()
+        assert (tmp_path / f"{result.project_id}.zip").exists()
+
+    async def test_download_invalid_id_returns_not_found(self, client):
+        """Test that requesting a non-existent project returns 404."""
+        response = await client.get("/api/download-project/nonexistent-id")
 
         assert response.status_code == 404